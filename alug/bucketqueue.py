@@ -0,0 +1,164 @@
+import collections, math, heapq
+from .heapset import _HeapSetBase
+
+
+class BucketQueue(_HeapSetBase):
+    """!
+    @brief Priority queue for monotone integer priorities, with the same interface as HeapSet.
+
+    Elements are kept in one bucket per priority.  The priorities must be integers, and no element
+    may be pushed with, or changed to, a priority lower than that of the most recently popped
+    element.  Within that restriction, elements come out in exactly the same order as from a HeapSet
+    with the same key function: by priority, and in order of push/recompute_key for equal
+    priorities.
+
+    Pushing to a priority that is already in use, discard and recompute_key are O(1).  pop, and
+    pushing to a new priority, are O(log b), where b is the number of distinct priorities in use,
+    independently of how widely spaced they are.
+    """
+    def __init__(self, elements, key=None):
+        """!
+        @param[in] elements	Sequence of hashable elements.
+        @param[in] key		Derives the integer priority from an element.
+                                If None, the elements are their own priorities.
+        """
+        self._key = (lambda ele: ele) if key is None else key
+        self._has_key_function = key is not None
+        self._buckets = dict()
+        self._ele_to_prio = dict()
+        # Heap of the priorities that have buckets.  Entries for buckets that have since been emptied
+        # are left behind, and skipped when they reach the top.
+        self._prio_heap = []
+        # Priority of the most recently popped element.
+        self._last_popped = -math.inf
+        for ele in elements:
+            self.push(ele)
+
+    def push(self, ele, priority=None):
+        """!
+        @param[in] ele		Element to add.
+        @param[in] priority	The priority of ele.  If None, the key function is called to get it.
+        """
+        if ele in self._ele_to_prio:
+            raise KeyError('already on heap')
+        self._insert(ele, self._key(ele) if priority is None else priority)
+
+    def push_many(self, elements):
+        """!
+        @brief Push all of 'elements'.
+        Raises KeyError and leaves the BucketQueue unchanged if any of the elements are already
+        queued, or occur more than once in 'elements'.
+        """
+        elements = list(elements)
+        ele_to_prio = self._ele_to_prio
+        if len(set(elements)) != len(elements) or any(ele in ele_to_prio for ele in elements):
+            raise KeyError('already on heap')
+        for ele in elements:
+            self._insert(ele, self._key(ele))
+
+    def _insert(self, ele, prio):
+        if prio < self._last_popped:
+            raise ValueError('priority %r is below the last popped priority %r' % (prio, self._last_popped))
+        try:
+            bucket = self._buckets[prio]
+        except KeyError:
+            bucket = self._buckets[prio] = collections.OrderedDict()
+            prio_heap = self._prio_heap
+            if len(prio_heap) > 2 * len(self._buckets) + 16:
+                # Mostly left-behind entries; rebuild from the buckets in use, which now include prio.
+                prio_heap[:] = self._buckets
+                heapq.heapify(prio_heap)
+            else:
+                heapq.heappush(prio_heap, prio)
+        bucket[ele] = None
+        self._ele_to_prio[ele] = prio
+
+    def _lowest_priority(self):
+        buckets = self._buckets
+        if not buckets:
+            raise IndexError('pop from empty BucketQueue')
+        prio_heap = self._prio_heap
+        while prio_heap[0] not in buckets:
+            heapq.heappop(prio_heap)
+        return prio_heap[0]
+
+    def pop(self):
+        prio = self._lowest_priority()
+        bucket = self._buckets[prio]
+        ele, _ = bucket.popitem(last=False)
+        if not bucket:
+            del self._buckets[prio]
+        del self._ele_to_prio[ele]
+        self._last_popped = prio
+        return ele
+
+    def peek(self):
+        return next(iter(self._buckets[self._lowest_priority()]))
+
+    def discard(self, ele):
+        try:
+            del self[ele]
+        except KeyError:
+            pass
+
+    def discard_many(self, elements):
+        for ele in elements:
+            self.discard(ele)
+
+    def __delitem__(self, ele):
+        prio = self._ele_to_prio.pop(ele)
+        bucket = self._buckets[prio]
+        del bucket[ele]
+        if not bucket:
+            del self._buckets[prio]
+
+    def recompute_key(self, ele):
+        """!
+        @brief Notify that the priority, as computed by the key function, has changed.
+        No-op if the element is not in the BucketQueue.
+        ValueError is raised, and the element keeps its old priority, if the new priority is below
+        the last popped priority.
+        """
+        assert self._has_key_function
+        if ele in self._ele_to_prio:
+            self.set_priority(ele, self._key(ele))
+
+    def recompute_keys(self, elements):
+        for ele in elements:
+            self.recompute_key(ele)
+
+    def set_priority(self, ele, priority):
+        """!
+        @brief Change the priority of an element to 'priority', without calling the key function.
+        Raises KeyError if the element is not in the BucketQueue.
+        """
+        if priority < self._last_popped:
+            raise ValueError('priority %r is below the last popped priority %r' % (priority, self._last_popped))
+        del self[ele]
+        self._insert(ele, priority)
+
+    def priority(self, ele):
+        """!
+        @brief The current priority of an element, as stored; the key function is not called.
+        """
+        return self._ele_to_prio[ele]
+
+    def __len__(self):
+        return len(self._ele_to_prio)
+
+    def __iter__(self):
+        # Iterates over a copy, so the BucketQueue may be changed while iterating.
+        buckets = self._buckets
+        return iter([ele for prio in sorted(buckets) for ele in buckets[prio]])
+
+    def iter_ordered(self):
+        """!
+        @brief Iterate over the elements in priority order, without copying the buckets.
+
+        The BucketQueue must not be changed while iterating.
+        """
+        for prio in sorted(self._buckets):
+            yield from self._buckets[prio]
+
+    def __contains__(self, ele):
+        return ele in self._ele_to_prio
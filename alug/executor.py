@@ -0,0 +1,90 @@
+import os, array
+import concurrent.futures
+from .heapset import HeapSet
+from .topo import _Graph, _peel
+
+
+def run_topologically(items, partial_order, fn, executor=None, max_workers=None, cycles='raise', cost=None):
+    """!
+    @brief Call fn on every item, in parallel, respecting the dependencies in partial_order.
+    @param[in] items		An iterable of hashable elements.
+    @param[in] partial_order	List of (before,after) dependencies: fn(after) is not called until fn(before)
+                                has returned.
+    @param[in] fn		The function to call on each item.
+    @param[in] executor		A concurrent.futures.Executor.  If None, a ThreadPoolExecutor is created
+                                and shut down when done.
+    @param[in] max_workers	Maximum number of calls in progress at a time; defaults to the number of CPUs.
+                                This should match the number of workers in 'executor'.
+    @param[in] cycles		'raise' to raise CycleError if partial_order has a cycle, or 'break' to
+                                drop the dependencies that semi_topological_sort would violate.
+    @param[in] cost		If not None, a function giving the expected cost of calling fn on an item.
+                                Ready items are then submitted costliest path to the end first, as in
+                                critical_path_topological_sort.
+    @return dict mapping each item to the return value of fn, in stable_topological_sort order.
+
+    Each item is submitted as soon as all its 'before' items are done.  When more items are ready
+    than there are free workers, the items that come first in stable_topological_sort (or
+    semi_topological_sort) order are submitted first, unless 'cost' is given.
+    If a call raises an exception, no further items are submitted, and the exception is re-raised
+    once the calls in progress have finished.
+    """
+    if cycles not in ('raise', 'break'):
+        raise ValueError("cycles must be 'raise' or 'break'")
+    if max_workers is not None and max_workers < 1:
+        raise ValueError('max_workers must be at least 1')
+    graph = _Graph(items, partial_order)
+    labels = graph.labels
+    order = _peel(graph, break_cycles=(cycles == 'break'))
+    rank = array.array('l', bytes(graph.n * graph.in_degree.itemsize))
+    for no,v in enumerate(order):
+        rank[v] = no
+
+    # Count only the dependencies that agree with the order; with cycles='raise', that's all of them.
+    out_adj, out_start = graph.out_adj, graph.out_start
+    waiting_for = array.array('l', bytes(graph.n * graph.in_degree.itemsize))
+    for v in range(graph.n):
+        for w in out_adj[out_start[v]:out_start[v+1]]:
+            if rank[v] < rank[w]:
+                waiting_for[w] += 1
+    if cost is None:
+        priority = rank.__getitem__
+    else:
+        # Longest path to the end, over the dependencies that are kept; order lists them in dependency order.
+        lengths = list(map(cost, labels))
+        for v in reversed(order):
+            longest = max((lengths[w] for w in out_adj[out_start[v]:out_start[v+1]] if rank[v] < rank[w]),
+                          default=0)
+            lengths[v] += longest
+        priority = lambda v: (-lengths[v], rank[v])
+    ready = HeapSet([v for v in range(graph.n) if waiting_for[v]==0], key=priority)
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    own_executor = executor is None
+    if own_executor:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+    results = dict()
+    in_flight = dict()
+    try:
+        while ready or in_flight:
+            while ready and len(in_flight) < max_workers:
+                v = ready.pop()
+                in_flight[executor.submit(fn, labels[v])] = v
+            done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                v = in_flight.pop(future)
+                results[v] = future.result()
+                for w in out_adj[out_start[v]:out_start[v+1]]:
+                    if rank[v] < rank[w]:
+                        waiting_for[w] -= 1
+                        if waiting_for[w]==0:
+                            ready.push(w)
+    except BaseException:
+        for future in in_flight:
+            future.cancel()
+        concurrent.futures.wait(in_flight)
+        raise
+    finally:
+        if own_executor:
+            executor.shutdown()
+    return { labels[v]:results[v] for v in order }
@@ -0,0 +1,228 @@
+import asyncio, collections, threading, time
+from .heapset import HeapSet
+
+
+class ThreadSafeHeapSet:
+    """!
+    @brief HeapSet that can be shared between threads, with a blocking pop.
+
+    All methods take a lock around the underlying heapset.  Unlike queue.PriorityQueue, elements
+    can be deleted and have their priority changed while on the queue.
+    """
+    def __init__(self, elements=(), key=None, heap_class=HeapSet):
+        """!
+        @param[in] elements	Sequence of hashable elements.
+        @param[in] key		Derives the priority from an element.
+        @param[in] heap_class	The heapset class to use: HeapSet, IndexedHeapSet, CompactHeapSet or
+                                BucketQueue, or for a BoundedHeapSet, functools.partial(BoundedHeapSet,
+                                capacity=...).
+        """
+        self._heapset = heap_class(elements, key=key)
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+
+    def push(self, ele, priority=None):
+        with self._lock:
+            res = self._heapset.push(ele, priority)
+            self._not_empty.notify()
+        return res
+
+    def push_many(self, elements):
+        elements = list(elements)
+        with self._lock:
+            res = self._heapset.push_many(elements)
+            self._not_empty.notify(len(elements))
+        return res
+
+    def pop(self, block=True, timeout=None):
+        """!
+        @brief Extract the lowest-priority element.
+        @param[in] block	If true, wait for an element to become available.
+        @param[in] timeout	Maximum number of seconds to wait, or None to wait indefinitely.
+        Raises IndexError if there is no element to pop, after waiting if 'block' is set.
+        """
+        with self._lock:
+            if block:
+                if timeout is None:
+                    while not self._heapset:
+                        self._not_empty.wait()
+                else:
+                    deadline = time.monotonic() + timeout
+                    while not self._heapset:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._not_empty.wait(remaining)
+            return self._heapset.pop()
+
+    def pop_n(self, k):
+        with self._lock:
+            return self._heapset.pop_n(k)
+
+    def peek(self):
+        with self._lock:
+            return self._heapset.peek()
+
+    def discard(self, ele):
+        with self._lock:
+            self._heapset.discard(ele)
+
+    def __delitem__(self, ele):
+        with self._lock:
+            del self._heapset[ele]
+
+    def discard_many(self, elements):
+        with self._lock:
+            self._heapset.discard_many(elements)
+
+    def recompute_key(self, ele):
+        with self._lock:
+            self._heapset.recompute_key(ele)
+
+    def recompute_keys(self, elements):
+        with self._lock:
+            self._heapset.recompute_keys(elements)
+
+    def set_priority(self, ele, priority):
+        with self._lock:
+            self._heapset.set_priority(ele, priority)
+
+    def priority(self, ele):
+        with self._lock:
+            return self._heapset.priority(ele)
+
+    def nsmallest(self, k):
+        with self._lock:
+            return self._heapset.nsmallest(k)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heapset)
+
+    def pop_all(self):
+        try:
+            while 1:
+                yield self.pop(block=False)
+        except IndexError:
+            pass
+
+    def __iter__(self):
+        # Iterates over a snapshot, so other threads are free to change the heapset meanwhile.
+        with self._lock:
+            return iter(list(self._heapset))
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __contains__(self, ele):
+        with self._lock:
+            return ele in self._heapset
+
+
+class AsyncHeapSet:
+    """!
+    @brief HeapSet for use within an asyncio event loop, with an awaitable pop.
+
+    Not thread-safe; all methods must be called from the event loop thread.  Unlike
+    asyncio.PriorityQueue, elements can be deleted and have their priority changed while on the
+    queue.
+    """
+    def __init__(self, elements=(), key=None, heap_class=HeapSet):
+        """!
+        @param[in] elements	Sequence of hashable elements.
+        @param[in] key		Derives the priority from an element.
+        @param[in] heap_class	The heapset class to use: HeapSet, IndexedHeapSet, CompactHeapSet or
+                                BucketQueue, or for a BoundedHeapSet, functools.partial(BoundedHeapSet,
+                                capacity=...).
+        """
+        self._heapset = heap_class(elements, key=key)
+        self._waiters = collections.deque()
+
+    def _wake_next(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def push(self, ele, priority=None):
+        res = self._heapset.push(ele, priority)
+        self._wake_next()
+        return res
+
+    def push_many(self, elements):
+        elements = list(elements)
+        res = self._heapset.push_many(elements)
+        for _ in elements:
+            self._wake_next()
+        return res
+
+    async def pop(self):
+        """!
+        @brief Extract the lowest-priority element, waiting for one to become available.
+        Use asyncio.wait_for to wait with a timeout.
+        """
+        while not self._heapset:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except BaseException:
+                waiter.cancel()
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+                # If we were woken and then cancelled, pass the wakeup on.
+                if self._heapset and not waiter.cancelled():
+                    self._wake_next()
+                raise
+        return self._heapset.pop()
+
+    def pop_nowait(self):
+        """!
+        @brief Extract the lowest-priority element. Raises IndexError if there is none.
+        """
+        return self._heapset.pop()
+
+    def pop_n(self, k):
+        return self._heapset.pop_n(k)
+
+    def peek(self):
+        return self._heapset.peek()
+
+    def discard(self, ele):
+        self._heapset.discard(ele)
+
+    def __delitem__(self, ele):
+        del self._heapset[ele]
+
+    def discard_many(self, elements):
+        self._heapset.discard_many(elements)
+
+    def recompute_key(self, ele):
+        self._heapset.recompute_key(ele)
+
+    def recompute_keys(self, elements):
+        self._heapset.recompute_keys(elements)
+
+    def set_priority(self, ele, priority):
+        self._heapset.set_priority(ele, priority)
+
+    def priority(self, ele):
+        return self._heapset.priority(ele)
+
+    def nsmallest(self, k):
+        return self._heapset.nsmallest(k)
+
+    def __len__(self):
+        return len(self._heapset)
+
+    def __iter__(self):
+        return iter(self._heapset)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __contains__(self, ele):
+        return ele in self._heapset
@@ -1,35 +1,146 @@
-import itertools, heapq
+import itertools, heapq, math, array
 
+# Heaps shorter than this are never compacted; rebuilding them gains next to nothing.
+_COMPACT_MIN_LEN = 64
 
-class HeapSet:
+# Batch operations rebuild the heap with heapify, instead of sifting in one element at a time,
+# when the batch is larger than the heap divided by this.
+_BULK_REBUILD_DIVISOR = 2
+
+
+def _ordered_decs(heap):
     """!
-    @brief Heap with efficient deletion and a key function option.
+    @brief Iterate over the entries of a heap in sorted order, without modifying it.
+
+    Walks the heap tree with a small frontier heap holding the children of the entries produced so
+    far, so producing the first k entries costs O(k log k) regardless of the size of the heap.
     """
-    def __init__(self, elements, key=None):
-        """!
-        @param[in] elements	Sequence of hashable elements.
-        @param[in] key		Derives
-        """
+    if not heap:
+        return
+    frontier = [(heap[0], 0)]
+    end = len(heap)
+    while frontier:
+        dec, pos = heapq.heappop(frontier)
+        yield dec
+        child_pos = 2*pos + 1
+        if child_pos < end:
+            heapq.heappush(frontier, (heap[child_pos], child_pos))
+            if child_pos + 1 < end:
+                heapq.heappush(frontier, (heap[child_pos + 1], child_pos + 1))
+
+
+class _HeapSetBase:
+    """!
+    @brief The methods that the heapset classes share, written in terms of their own push, pop,
+    __len__ and iter_ordered.
+
+    The decorating classes (HeapSet, IndexedHeapSet and BoundedHeapSet) call _set_key_function from
+    __init__, and define _dec_of to look up the decorated entry of an element, and _redecorate to
+    replace their entries when switching to (priority, seq, ele) entries.
+    """
+    def _set_key_function(self, key):
+        self._has_key_function = key is not None
         if key is None:
+            # The entries are the elements themselves, until an explicit priority is given.
             self._decorate = lambda ele: ele
             self._undecorate = lambda dec: dec
+            self._decorated = False
         else:
-            counter = iter(itertools.count())
-            self._decorate = lambda ele: (key(ele), next(counter), ele)
-            self._undecorate = lambda dec: dec[-1]
-        self._has_key_function = key is not None
+            self._use_tuples(key)
+
+    def _use_tuples(self, key):
+        counter = self._counter = itertools.count()
+        self._decorate = lambda ele: (key(ele), next(counter), ele)
+        self._undecorate = lambda dec: dec[-1]
+        self._decorated = True
+
+    def _decorate_with(self, ele, priority):
+        if not self._decorated:
+            # Bare elements can't be mixed with explicit priorities, so switch to (priority, seq, ele)
+            # entries, with each element as its own priority.  This happens once, in O(n).
+            elements = list(self)
+            self._use_tuples(lambda ele: ele)
+            self._redecorate(elements)
+        return (priority, next(self._counter), ele)
+
+    def priority(self, ele):
+        """!
+        @brief The current priority of an element, as stored; the key function is not called.
+        """
+        dec = self._dec_of(ele)
+        return dec[0] if self._decorated else dec
+
+    def pop_all(self):
+        try:
+            while 1:
+                yield self.pop()
+        except IndexError:
+            pass
+
+    def pop_n(self, k):
+        """!
+        @brief Pop up to k elements.
+        @return list of the popped elements, in priority order.
+        """
+        res = []
+        while len(res) < k and self:
+            res.append(self.pop())
+        return res
+
+    def nsmallest(self, k):
+        """!
+        @brief The k first elements in priority order, without changing the heapset.
+        """
+        return list(itertools.islice(self.iter_ordered(), k))
+
+    def __bool__(self):
+        return len(self) > 0
+
+
+class HeapSet(_HeapSetBase):
+    """!
+    @brief Heap with efficient deletion and a key function option.
+    """
+    def __init__(self, elements, key=None, compact_threshold=0.5):
+        """!
+        @param[in] elements	Sequence of hashable elements.
+        @param[in] key		Derives the priority from an element.
+        @param[in] compact_threshold	When the fraction of dead entries in the underlying heap exceeds
+                                        this, the heap is rebuilt from the live entries.
+                                        None disables automatic compaction.
+        """
+        self._set_key_function(key)
+        self._compact_threshold = math.inf if compact_threshold is None else compact_threshold
         self._heap_of_decs = list(map(self._decorate, elements))
         self._ele_to_dec = dict(zip(elements, self._heap_of_decs))
         heapq.heapify(self._heap_of_decs)
         assert len(self._heap_of_decs) == len(self._ele_to_dec) # ensures that 'elements' are re-iterable.
 
-    def push(self, ele):
+    def push(self, ele, priority=None):
+        """!
+        @param[in] ele		Element to add.
+        @param[in] priority	The priority of ele.  If None, the key function is called to get it.
+        """
         if ele in self._ele_to_dec:
             raise KeyError('already on heap')
-        dec = self._decorate(ele)
+        dec = self._decorate(ele) if priority is None else self._decorate_with(ele, priority)
         self._ele_to_dec[ele] = dec
         heapq.heappush(self._heap_of_decs, dec)
 
+    def push_many(self, elements):
+        """!
+        @brief Push all of 'elements'.
+        Raises KeyError and leaves the HeapSet unchanged if any of the elements are already on the
+        heap, or occur more than once in 'elements'.
+        """
+        elements = list(elements)
+        ele_to_dec = self._ele_to_dec
+        if len(set(elements)) != len(elements) or any(ele in ele_to_dec for ele in elements):
+            raise KeyError('already on heap')
+        decs = list(map(self._decorate, elements))
+        ele_to_dec.update(zip(elements, decs))
+        self._add_decs(decs)
+
     def pop(self):
         while 1:
             dec = heapq.heappop(self._heap_of_decs)
@@ -42,21 +153,35 @@ class HeapSet:
         # Deletes from _ele_to_dec but not _heap_of_decs.
         # Works only because pop/discard/peek doublechecks heappop results against _ele_to_dec also.
         # Deleted elements remain in _heap_of_decs until that happens.
+        # Compaction keeps the number of such dead entries bounded.
         try:
             del self._ele_to_dec[ele]
         except KeyError:
             pass
+        else:
+            self._maybe_compact()
 
     def __delitem__(self, ele):
         del self._ele_to_dec[ele]
+        self._maybe_compact()
+
+    def discard_many(self, elements):
+        """!
+        @brief Discard all of 'elements'. Elements that are not in the HeapSet are ignored.
+        """
+        ele_to_dec = self._ele_to_dec
+        for ele in elements:
+            ele_to_dec.pop(ele, None)
+        self._maybe_compact()
 
     def peek(self):
+        heap = self._heap_of_decs
         while 1:
-            dec = heapq.heappop(self._heap_of_decs)
+            dec = heap[0]
             ele = self._undecorate(dec)
             if ele in self._ele_to_dec and dec is self._ele_to_dec[ele]:
-                heapq.heappush(self._heap_of_decs, dec)
-                return res
+                return ele
+            heapq.heappop(heap)
 
     def recompute_key(self, ele):
         """!
@@ -73,28 +198,939 @@ class HeapSet:
             pass
         else:
             self.push(ele)
+            self._maybe_compact()
+
+    def set_priority(self, ele, priority):
+        """!
+        @brief Change the priority of an element to 'priority', without calling the key function.
+        Raises KeyError if the element is not in the HeapSet.
+        """
+        if ele not in self._ele_to_dec:
+            raise KeyError(ele)
+        self._ele_to_dec[ele] = dec = self._decorate_with(ele, priority)
+        heapq.heappush(self._heap_of_decs, dec)
+        self._maybe_compact()
+
+    def _dec_of(self, ele):
+        return self._ele_to_dec[ele]
+
+    def _redecorate(self, elements):
+        self._ele_to_dec = dict(zip(elements, map(self._decorate, elements)))
+        self.compact()
+
+    def recompute_keys(self, elements):
+        """!
+        @brief Like recompute_key, for all of 'elements'.
+        """
+        assert self._has_key_function
+        ele_to_dec = self._ele_to_dec
+        decorate = self._decorate
+        decs = []
+        for ele in elements:
+            if ele in ele_to_dec:
+                ele_to_dec[ele] = dec = decorate(ele)
+                decs.append(dec)
+        self._add_decs(decs)
+        self._maybe_compact()
+
+    def _add_decs(self, decs):
+        # decs are already in _ele_to_dec; add them to the heap as well.
+        heap = self._heap_of_decs
+        if len(decs) * _BULK_REBUILD_DIVISOR > len(heap):
+            self.compact()
+        else:
+            for dec in decs:
+                heapq.heappush(heap, dec)
+
+    def compact(self):
+        """!
+        @brief Rebuild the underlying heap from the live entries, dropping all dead entries.
+        """
+        self._heap_of_decs = list(self._ele_to_dec.values())
+        heapq.heapify(self._heap_of_decs)
+
+    def _maybe_compact(self):
+        heap_len = len(self._heap_of_decs)
+        if heap_len >= _COMPACT_MIN_LEN and heap_len - len(self._ele_to_dec) > self._compact_threshold * heap_len:
+            self.compact()
+
+    @property
+    def live_count(self):
+        """!
+        @brief Number of entries in the underlying heap that are elements of the HeapSet.
+        """
+        return len(self._ele_to_dec)
+
+    @property
+    def dead_count(self):
+        """!
+        @brief Number of entries in the underlying heap left behind by deletions and priority changes.
+        """
+        return len(self._heap_of_decs) - len(self._ele_to_dec)
 
     def __len__(self):
         return len(self._ele_to_dec)
 
-    def pop_all(self):
+    def __iter__(self):
+        # Iterates over a copy, so the HeapSet may be changed while iterating.
+        heap = list(self._ele_to_dec.values())
+        heapq.heapify(heap)
+        for dec in _ordered_decs(heap):
+            yield self._undecorate(dec)
+
+    def iter_ordered(self):
+        """!
+        @brief Iterate over the elements in priority order, without copying the heap.
+
+        The first k elements cost O(k log k) regardless of the size of the HeapSet.  The HeapSet
+        must not be changed while iterating; if it is, RuntimeError is raised.
+        """
+        heap = self._heap_of_decs
+        ele_to_dec = self._ele_to_dec
+        heap_len = len(heap)
+        ele_count = len(ele_to_dec)
+        # Without a key function, an entry is the element itself, so a dead entry for an element that
+        # was pushed again passes the identity check too; skip the elements already produced.
+        produced = None if self._decorated else set()
+        for dec in _ordered_decs(heap):
+            ele = self._undecorate(dec)
+            if ele in ele_to_dec and dec is ele_to_dec[ele]:
+                if produced is not None:
+                    if ele in produced:
+                        continue
+                    produced.add(ele)
+                yield ele
+                if self._heap_of_decs is not heap or len(heap) != heap_len or len(ele_to_dec) != ele_count:
+                    raise RuntimeError('HeapSet changed during iteration')
+
+    def __contains__(self, ele):
+        return ele in self._ele_to_dec
+
+
+class CountingHeapSet(HeapSet):
+    """!
+    @brief HeapSet that counts what it does, for profiling.
+
+    The counts are in these attributes:
+     * key_calls: the number of calls of the key function.
+     * stale_skipped: the number of dead entries that pop and peek have had to skip over.
+     * peak_len: the largest length that the underlying heap has had, counting dead entries.
+    Counting makes it slower than HeapSet, so use HeapSet when the counts are not needed.
+    """
+    def __init__(self, elements, key=None, compact_threshold=0.5):
+        self.key_calls = 0
+        self.stale_skipped = 0
+        if key is not None:
+            counted_key = key
+            def key(ele):
+                self.key_calls += 1
+                return counted_key(ele)
+        super().__init__(elements, key, compact_threshold)
+        self.peak_len = len(self._heap_of_decs)
+
+    def _note_len(self):
+        if len(self._heap_of_decs) > self.peak_len:
+            self.peak_len = len(self._heap_of_decs)
+
+    def push(self, ele, priority=None):
+        super().push(ele, priority)
+        self._note_len()
+
+    def set_priority(self, ele, priority):
+        super().set_priority(ele, priority)
+        self._note_len()
+
+    def _add_decs(self, decs):
+        super()._add_decs(decs)
+        self._note_len()
+
+    def pop(self):
+        heap_len = len(self._heap_of_decs)
         try:
-            while 1:
-                yield self.pop()
+            ele = super().pop()
         except IndexError:
-            pass
+            self.stale_skipped += heap_len
+            raise
+        self.stale_skipped += heap_len - len(self._heap_of_decs) - 1
+        return ele
+
+    def peek(self):
+        heap_len = len(self._heap_of_decs)
+        try:
+            return super().peek()
+        finally:
+            self.stale_skipped += heap_len - len(self._heap_of_decs)
+
+
+class IndexedHeapSet(_HeapSetBase):
+    """!
+    @brief HeapSet variant that keeps track of the heap position of each element.
+
+    Deletion and priority change sift the element's entry into place instead of leaving a dead
+    entry behind, so the heap holds exactly the live elements.
+    """
+    def __init__(self, elements, key=None):
+        """!
+        @param[in] elements	Sequence of hashable elements.
+        @param[in] key		Derives the priority from an element.
+        """
+        self._set_key_function(key)
+        self._heap_of_decs = list(map(self._decorate, elements))
+        heapq.heapify(self._heap_of_decs)
+        undecorate = self._undecorate
+        self._ele_to_pos = dict((undecorate(dec), pos) for pos,dec in enumerate(self._heap_of_decs))
+        assert len(self._heap_of_decs) == len(self._ele_to_pos) # no duplicates in 'elements'.
+
+    def push(self, ele, priority=None):
+        """!
+        @param[in] ele		Element to add.
+        @param[in] priority	The priority of ele.  If None, the key function is called to get it.
+        """
+        if ele in self._ele_to_pos:
+            raise KeyError('already on heap')
+        dec = self._decorate(ele) if priority is None else self._decorate_with(ele, priority)
+        self._heap_of_decs.append(dec)
+        self._sift_up(len(self._heap_of_decs) - 1)
+
+    def push_many(self, elements):
+        """!
+        @brief Push all of 'elements'.
+        Raises KeyError and leaves the IndexedHeapSet unchanged if any of the elements are already
+        on the heap, or occur more than once in 'elements'.
+        """
+        elements = list(elements)
+        ele_to_pos = self._ele_to_pos
+        if len(set(elements)) != len(elements) or any(ele in ele_to_pos for ele in elements):
+            raise KeyError('already on heap')
+        heap = self._heap_of_decs
+        start = len(heap)
+        heap.extend(map(self._decorate, elements))
+        if len(elements) * _BULK_REBUILD_DIVISOR > start:
+            self._rebuild()
+        else:
+            for pos in range(start, len(heap)):
+                self._sift_up(pos)
+
+    def pop(self):
+        heap = self._heap_of_decs
+        last = heap.pop()
+        if heap:
+            dec = heap[0]
+            heap[0] = last
+            self._sift_down(0)
+        else:
+            dec = last
+        ele = self._undecorate(dec)
+        del self._ele_to_pos[ele]
+        return ele
+
+    def discard(self, ele):
+        pos = self._ele_to_pos.pop(ele, None)
+        if pos is not None:
+            self._remove_at(pos)
+
+    def __delitem__(self, ele):
+        self._remove_at(self._ele_to_pos.pop(ele))
+
+    def discard_many(self, elements):
+        """!
+        @brief Discard all of 'elements'. Elements that are not in the IndexedHeapSet are ignored.
+        """
+        elements = list(elements)
+        if len(elements) * _BULK_REBUILD_DIVISOR > len(self._heap_of_decs):
+            ele_to_pos = self._ele_to_pos
+            for ele in elements:
+                ele_to_pos.pop(ele, None)
+            undecorate = self._undecorate
+            self._heap_of_decs = [dec for dec in self._heap_of_decs if undecorate(dec) in ele_to_pos]
+            self._rebuild()
+        else:
+            for ele in elements:
+                self.discard(ele)
+
+    def peek(self):
+        return self._undecorate(self._heap_of_decs[0])
+
+    def recompute_key(self, ele):
+        """!
+        @brief Notify that the priority, as computed by the key function, has changed.
+        The element's entry is moved to its new place in the heap; no-op if the element is not in
+        the IndexedHeapSet.
+        """
+        assert self._has_key_function
+        pos = self._ele_to_pos.get(ele)
+        if pos is not None:
+            self._replace_at(pos, self._decorate(ele))
+
+    def set_priority(self, ele, priority):
+        """!
+        @brief Change the priority of an element to 'priority', without calling the key function.
+        Raises KeyError if the element is not in the IndexedHeapSet.
+        """
+        if ele not in self._ele_to_pos:
+            raise KeyError(ele)
+        # _decorate_with may rebuild the heap, so look the position up afterwards.
+        dec = self._decorate_with(ele, priority)
+        self._replace_at(self._ele_to_pos[ele], dec)
+
+    def _dec_of(self, ele):
+        return self._heap_of_decs[self._ele_to_pos[ele]]
+
+    def _redecorate(self, elements):
+        self._heap_of_decs = list(map(self._decorate, elements))
+        self._rebuild()
+
+    def _replace_at(self, pos, dec):
+        heap = self._heap_of_decs
+        old_dec = heap[pos]
+        heap[pos] = dec
+        if dec < old_dec:
+            self._sift_up(pos)
+        else:
+            self._sift_down(pos)
+
+    def recompute_keys(self, elements):
+        """!
+        @brief Like recompute_key, for all of 'elements'.
+        """
+        assert self._has_key_function
+        elements = list(elements)
+        if len(elements) * _BULK_REBUILD_DIVISOR > len(self._heap_of_decs):
+            heap = self._heap_of_decs
+            ele_to_pos = self._ele_to_pos
+            decorate = self._decorate
+            for ele in elements:
+                pos = ele_to_pos.get(ele)
+                if pos is not None:
+                    heap[pos] = decorate(ele)
+            self._rebuild()
+        else:
+            for ele in elements:
+                self.recompute_key(ele)
+
+    def _rebuild(self):
+        # Restore the heap invariant and the position index from scratch.
+        heap = self._heap_of_decs
+        heapq.heapify(heap)
+        undecorate = self._undecorate
+        self._ele_to_pos = dict((undecorate(dec), pos) for pos,dec in enumerate(heap))
+
+    def _remove_at(self, pos):
+        # The element at pos has already been removed from _ele_to_pos.
+        heap = self._heap_of_decs
+        last = heap.pop()
+        if pos < len(heap):
+            heap[pos] = last
+            if pos > 0 and last < heap[(pos - 1) >> 1]:
+                self._sift_up(pos)
+            else:
+                self._sift_down(pos)
+
+    def _sift_up(self, pos):
+        # Move the entry at pos towards the root until the heap invariant holds.
+        heap = self._heap_of_decs
+        ele_to_pos = self._ele_to_pos
+        undecorate = self._undecorate
+        dec = heap[pos]
+        while pos > 0:
+            parent_pos = (pos - 1) >> 1
+            parent = heap[parent_pos]
+            if not dec < parent:
+                break
+            heap[pos] = parent
+            ele_to_pos[undecorate(parent)] = pos
+            pos = parent_pos
+        heap[pos] = dec
+        ele_to_pos[undecorate(dec)] = pos
+
+    def _sift_down(self, pos):
+        # Move the entry at pos towards the leaves until the heap invariant holds.
+        heap = self._heap_of_decs
+        ele_to_pos = self._ele_to_pos
+        undecorate = self._undecorate
+        end = len(heap)
+        dec = heap[pos]
+        child_pos = 2*pos + 1
+        while child_pos < end:
+            right_pos = child_pos + 1
+            if right_pos < end and heap[right_pos] < heap[child_pos]:
+                child_pos = right_pos
+            child = heap[child_pos]
+            if not child < dec:
+                break
+            heap[pos] = child
+            ele_to_pos[undecorate(child)] = pos
+            pos = child_pos
+            child_pos = 2*pos + 1
+        heap[pos] = dec
+        ele_to_pos[undecorate(dec)] = pos
+
+    def __len__(self):
+        return len(self._heap_of_decs)
 
     def __iter__(self):
-        heap = self._heap_of_decs.copy()
-        decs = self._ele_to_dec.copy()
-        while heap:
-            dec = heapq.heappop(heap)
-            ele = self._undecorate(dec)
-            if ele in decs and dec is decs[ele]:
-                yield ele
+        # Iterates over a copy, so the IndexedHeapSet may be changed while iterating.
+        return map(self._undecorate, _ordered_decs(list(self._heap_of_decs)))
 
-    def __bool__(self):
-        return len(self) > 0
+    def iter_ordered(self):
+        """!
+        @brief Iterate over the elements in priority order, without copying the heap.
+
+        The first k elements cost O(k log k) regardless of the size of the IndexedHeapSet.  The
+        IndexedHeapSet must not be changed while iterating; if it is, RuntimeError is raised.
+        """
+        heap = self._heap_of_decs
+        heap_len = len(heap)
+        for dec in _ordered_decs(heap):
+            yield self._undecorate(dec)
+            if self._heap_of_decs is not heap or len(heap) != heap_len:
+                raise RuntimeError('IndexedHeapSet changed during iteration')
 
     def __contains__(self, ele):
-        return ele in self._ele_to_dec
+        return ele in self._ele_to_pos
+
+
+class CompactHeapSet(_HeapSetBase):
+    """!
+    @brief HeapSet variant for numeric priorities that keeps its bookkeeping in typed arrays.
+
+    Each element gets a slot number.  Priorities, sequence numbers (for tie breaking in push order)
+    and heap positions are stored per slot in `array.array` buffers, and the heap itself is an array
+    of slot numbers.  This uses much less memory per element than the tuples of HeapSet, at the cost
+    of slower comparisons.  Like IndexedHeapSet, deletion and priority change are done in place.
+    """
+    def __init__(self, elements, key=None, typecode='d'):
+        """!
+        @param[in] elements	Sequence of hashable elements.
+        @param[in] key		Derives the numeric priority from an element.
+                                If None, the elements are numbers and are their own priorities.
+        @param[in] typecode	`array` typecode for storing priorities; 'd' for floats, or 'q' for
+                                64-bit integers.
+        """
+        self._key = (lambda ele: ele) if key is None else key
+        self._has_key_function = key is not None
+        self._prios = array.array(typecode)
+        self._seqs = array.array('q')
+        self._slot_pos = array.array('q')
+        self._heap = array.array('q')
+        self._elements = []
+        self._free_slots = []
+        self._ele_to_slot = dict()
+        self._next_seq = 0
+        self.push_many(elements)
+
+    def _new_slot(self, ele, priority):
+        # Allocates a slot for ele and appends it to the end of the heap, without sifting it.
+        if self._free_slots:
+            slot = self._free_slots.pop()
+            self._prios[slot] = priority
+            self._seqs[slot] = self._next_seq
+            self._slot_pos[slot] = len(self._heap)
+            self._elements[slot] = ele
+        else:
+            slot = len(self._elements)
+            self._prios.append(priority)
+            self._seqs.append(self._next_seq)
+            self._slot_pos.append(len(self._heap))
+            self._elements.append(ele)
+        self._next_seq += 1
+        self._ele_to_slot[ele] = slot
+        self._heap.append(slot)
+
+    def _free_slot(self, slot):
+        del self._ele_to_slot[self._elements[slot]]
+        self._elements[slot] = None
+        self._slot_pos[slot] = -1
+        self._free_slots.append(slot)
+
+    def push(self, ele, priority=None):
+        """!
+        @param[in] ele		Element to add.
+        @param[in] priority	The priority of ele.  If None, the key function is called to get it.
+        """
+        if ele in self._ele_to_slot:
+            raise KeyError('already on heap')
+        self._new_slot(ele, self._key(ele) if priority is None else priority)
+        self._sift_up(len(self._heap) - 1)
+
+    def push_many(self, elements):
+        """!
+        @brief Push all of 'elements'.
+        Raises KeyError and leaves the CompactHeapSet unchanged if any of the elements are already
+        on the heap, or occur more than once in 'elements'.
+        """
+        elements = list(elements)
+        ele_to_slot = self._ele_to_slot
+        if len(set(elements)) != len(elements) or any(ele in ele_to_slot for ele in elements):
+            raise KeyError('already on heap')
+        priorities = array.array(self._prios.typecode, map(self._key, elements))
+        start = len(self._heap)
+        for ele,priority in zip(elements, priorities):
+            self._new_slot(ele, priority)
+        if len(elements) * _BULK_REBUILD_DIVISOR > start:
+            self._rebuild()
+        else:
+            for pos in range(start, len(self._heap)):
+                self._sift_up(pos)
+
+    def pop(self):
+        heap = self._heap
+        last = heap.pop()
+        if heap:
+            slot = heap[0]
+            heap[0] = last
+            self._slot_pos[last] = 0
+            self._sift_down(0)
+        else:
+            slot = last
+        ele = self._elements[slot]
+        self._free_slot(slot)
+        return ele
+
+    def peek(self):
+        return self._elements[self._heap[0]]
+
+    def discard(self, ele):
+        slot = self._ele_to_slot.get(ele)
+        if slot is not None:
+            self._remove_slot(slot)
+
+    def __delitem__(self, ele):
+        self._remove_slot(self._ele_to_slot[ele])
+
+    def discard_many(self, elements):
+        """!
+        @brief Discard all of 'elements'. Elements that are not in the CompactHeapSet are ignored.
+        """
+        elements = list(elements)
+        if len(elements) * _BULK_REBUILD_DIVISOR > len(self._heap):
+            ele_to_slot = self._ele_to_slot
+            for ele in elements:
+                slot = ele_to_slot.get(ele)
+                if slot is not None:
+                    self._free_slot(slot)
+            slot_pos = self._slot_pos
+            self._heap = array.array('q', [slot for slot in self._heap if slot_pos[slot] >= 0])
+            self._rebuild()
+        else:
+            for ele in elements:
+                self.discard(ele)
+
+    def _remove_slot(self, slot):
+        heap = self._heap
+        pos = self._slot_pos[slot]
+        last = heap.pop()
+        if pos < len(heap):
+            heap[pos] = last
+            self._slot_pos[last] = pos
+            if pos > 0 and self._less(last, heap[(pos - 1) >> 1]):
+                self._sift_up(pos)
+            else:
+                self._sift_down(pos)
+        self._free_slot(slot)
+
+    def recompute_key(self, ele):
+        """!
+        @brief Notify that the priority, as computed by the key function, has changed.
+        No-op if the element is not in the CompactHeapSet.
+        """
+        assert self._has_key_function
+        slot = self._ele_to_slot.get(ele)
+        if slot is not None:
+            self._reprioritise(slot, self._key(ele))
+
+    def recompute_keys(self, elements):
+        """!
+        @brief Like recompute_key, for all of 'elements'.
+        """
+        assert self._has_key_function
+        elements = list(elements)
+        if len(elements) * _BULK_REBUILD_DIVISOR > len(self._heap):
+            for ele in elements:
+                slot = self._ele_to_slot.get(ele)
+                if slot is not None:
+                    self._prios[slot] = self._key(ele)
+                    self._seqs[slot] = self._next_seq
+                    self._next_seq += 1
+            self._rebuild()
+        else:
+            for ele in elements:
+                self.recompute_key(ele)
+
+    def set_priority(self, ele, priority):
+        """!
+        @brief Change the priority of an element to 'priority', without calling the key function.
+        Raises KeyError if the element is not in the CompactHeapSet.
+        """
+        self._reprioritise(self._ele_to_slot[ele], priority)
+
+    def priority(self, ele):
+        """!
+        @brief The current priority of an element, as stored; the key function is not called.
+        """
+        return self._prios[self._ele_to_slot[ele]]
+
+    def _reprioritise(self, slot, priority):
+        # A priority change counts as a fresh push for tie breaking, as in HeapSet.
+        prios = self._prios
+        went_down = priority < prios[slot]
+        prios[slot] = priority
+        self._seqs[slot] = self._next_seq
+        self._next_seq += 1
+        if went_down:
+            self._sift_up(self._slot_pos[slot])
+        else:
+            self._sift_down(self._slot_pos[slot])
+
+    def _less(self, slot_a, slot_b):
+        prio_a = self._prios[slot_a]
+        prio_b = self._prios[slot_b]
+        return prio_a < prio_b or (prio_a == prio_b and self._seqs[slot_a] < self._seqs[slot_b])
+
+    def _sift_up(self, pos):
+        # Move the slot at pos towards the root until the heap invariant holds.
+        heap = self._heap
+        slot_pos = self._slot_pos
+        less = self._less
+        slot = heap[pos]
+        while pos > 0:
+            parent_pos = (pos - 1) >> 1
+            parent = heap[parent_pos]
+            if not less(slot, parent):
+                break
+            heap[pos] = parent
+            slot_pos[parent] = pos
+            pos = parent_pos
+        heap[pos] = slot
+        slot_pos[slot] = pos
+
+    def _sift_down(self, pos):
+        # Move the slot at pos towards the leaves until the heap invariant holds.
+        heap = self._heap
+        slot_pos = self._slot_pos
+        less = self._less
+        end = len(heap)
+        slot = heap[pos]
+        child_pos = 2*pos + 1
+        while child_pos < end:
+            right_pos = child_pos + 1
+            if right_pos < end and less(heap[right_pos], heap[child_pos]):
+                child_pos = right_pos
+            child = heap[child_pos]
+            if not less(child, slot):
+                break
+            heap[pos] = child
+            slot_pos[child] = pos
+            pos = child_pos
+            child_pos = 2*pos + 1
+        heap[pos] = slot
+        slot_pos[slot] = pos
+
+    def _rebuild(self):
+        # Restore the heap invariant and the position index from scratch.
+        slot_pos = self._slot_pos
+        for pos,slot in enumerate(self._heap):
+            slot_pos[slot] = pos
+        for pos in reversed(range(len(self._heap) // 2)):
+            self._sift_down(pos)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __iter__(self):
+        # Iterates over a copy, so the CompactHeapSet may be changed while iterating.
+        prios = self._prios
+        seqs = self._seqs
+        elements = self._elements
+        heap = [(prios[slot], seqs[slot], elements[slot]) for slot in self._heap]
+        for _, _, ele in _ordered_decs(heap):
+            yield ele
+
+    def iter_ordered(self):
+        """!
+        @brief Iterate over the elements in priority order, without copying the heap.
+
+        The first k elements cost O(k log k) regardless of the size of the CompactHeapSet.  The
+        CompactHeapSet must not be changed while iterating; if it is, RuntimeError is raised.
+        """
+        # Same frontier walk as _ordered_decs, on (priority, seq) pairs.
+        heap = self._heap
+        if not heap:
+            return
+        prios = self._prios
+        seqs = self._seqs
+        heap_len = len(heap)
+        def entry(pos):
+            slot = heap[pos]
+            return (prios[slot], seqs[slot], pos)
+        frontier = [entry(0)]
+        while frontier:
+            _, _, pos = heapq.heappop(frontier)
+            yield self._elements[heap[pos]]
+            if self._heap is not heap or len(heap) != heap_len:
+                raise RuntimeError('CompactHeapSet changed during iteration')
+            child_pos = 2*pos + 1
+            if child_pos < heap_len:
+                heapq.heappush(frontier, entry(child_pos))
+                if child_pos + 1 < heap_len:
+                    heapq.heappush(frontier, entry(child_pos + 1))
+
+    def __contains__(self, ele):
+        return ele in self._ele_to_slot
+
+
+def _is_min_level(pos):
+    # In a min-max heap, levels 0, 2, 4... are min levels, the others are max levels.
+    return (pos + 1).bit_length() & 1
+
+
+class BoundedHeapSet(_HeapSetBase):
+    """!
+    @brief HeapSet with a capacity, which evicts its highest-priority element when full.
+
+    Keeps the 'capacity' lowest-priority elements seen, for example the best K of a stream of
+    ranked items.  Backed by an indexed min-max heap, so both the lowest- and the highest-priority
+    element can be peeked in O(1) and popped in O(log n), and deletion and priority change are done
+    in place as in IndexedHeapSet.
+    """
+    def __init__(self, elements, capacity, key=None):
+        """!
+        @param[in] elements	Sequence of hashable elements.
+        @param[in] capacity	Maximum number of elements.
+        @param[in] key		Derives the priority from an element.
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self._set_key_function(key)
+        self.capacity = capacity
+        self._heap_of_decs = []
+        self._ele_to_pos = dict()
+        for ele in elements:
+            self.push(ele)
+
+    def push(self, ele, priority=None):
+        """!
+        @param[in] ele		Element to add.
+        @param[in] priority	The priority of ele.  If None, the key function is called to get it.
+        @return the element evicted to stay within capacity, which may be ele itself, or None.
+        """
+        if ele in self._ele_to_pos:
+            raise KeyError('already on heap')
+        dec = self._decorate(ele) if priority is None else self._decorate_with(ele, priority)
+        heap = self._heap_of_decs
+        if len(heap) >= self.capacity:
+            max_pos = self._max_pos()
+            if not dec < heap[max_pos]:
+                return ele
+            evicted = self._undecorate(heap[max_pos])
+            del self._ele_to_pos[evicted]
+            self._remove_at(max_pos)
+        else:
+            evicted = None
+        heap.append(dec)
+        self._ele_to_pos[ele] = len(heap) - 1
+        self._push_up(len(heap) - 1)
+        return evicted
+
+    def push_many(self, elements):
+        """!
+        @brief Push all of 'elements', evicting as push does.
+        Raises KeyError and leaves the BoundedHeapSet unchanged if any of the elements are already
+        on the heap, or occur more than once in 'elements'.
+        @return list of the elements evicted to stay within capacity, in the order they were evicted.
+        """
+        elements = list(elements)
+        ele_to_pos = self._ele_to_pos
+        if len(set(elements)) != len(elements) or any(ele in ele_to_pos for ele in elements):
+            raise KeyError('already on heap')
+        evicted = []
+        for ele in elements:
+            ele = self.push(ele)
+            if ele is not None:
+                evicted.append(ele)
+        return evicted
+
+    def pop(self):
+        """!
+        @brief Extract the lowest-priority element.
+        """
+        return self._pop_at(0)
+
+    def pop_max(self):
+        """!
+        @brief Extract the highest-priority element; the one that would be evicted next.
+        """
+        return self._pop_at(self._max_pos())
+
+    def peek(self):
+        return self._undecorate(self._heap_of_decs[0])
+
+    def peek_max(self):
+        return self._undecorate(self._heap_of_decs[self._max_pos()])
+
+    def _max_pos(self):
+        heap = self._heap_of_decs
+        if len(heap) <= 2:
+            return len(heap) - 1 if heap else 0
+        return 1 if heap[2] < heap[1] else 2
+
+    def _pop_at(self, pos):
+        ele = self._undecorate(self._heap_of_decs[pos])
+        del self._ele_to_pos[ele]
+        self._remove_at(pos)
+        return ele
+
+    def discard(self, ele):
+        pos = self._ele_to_pos.pop(ele, None)
+        if pos is not None:
+            self._remove_at(pos)
+
+    def __delitem__(self, ele):
+        self._remove_at(self._ele_to_pos.pop(ele))
+
+    def discard_many(self, elements):
+        """!
+        @brief Discard all of 'elements'. Elements that are not in the BoundedHeapSet are ignored.
+        """
+        for ele in elements:
+            self.discard(ele)
+
+    def recompute_key(self, ele):
+        """!
+        @brief Notify that the priority, as computed by the key function, has changed.
+        No-op if the element is not in the BoundedHeapSet.
+        """
+        assert self._has_key_function
+        pos = self._ele_to_pos.get(ele)
+        if pos is not None:
+            self._replace_at(pos, self._decorate(ele))
+
+    def recompute_keys(self, elements):
+        """!
+        @brief Like recompute_key, for all of 'elements'.
+        """
+        for ele in elements:
+            self.recompute_key(ele)
+
+    def set_priority(self, ele, priority):
+        """!
+        @brief Change the priority of an element to 'priority', without calling the key function.
+        Raises KeyError if the element is not in the BoundedHeapSet.
+        """
+        if ele not in self._ele_to_pos:
+            raise KeyError(ele)
+        # _decorate_with may rebuild the heap, so look the position up afterwards.
+        dec = self._decorate_with(ele, priority)
+        self._replace_at(self._ele_to_pos[ele], dec)
+
+    def _dec_of(self, ele):
+        return self._heap_of_decs[self._ele_to_pos[ele]]
+
+    def _redecorate(self, elements):
+        self._heap_of_decs = []
+        self._ele_to_pos = dict()
+        for ele in elements:
+            self.push(ele)
+
+    def _replace_at(self, pos, dec):
+        self._heap_of_decs[pos] = dec
+        self._fix(pos)
+
+    def _remove_at(self, pos):
+        # The element at pos has already been removed from _ele_to_pos.
+        heap = self._heap_of_decs
+        last = heap.pop()
+        if pos < len(heap):
+            heap[pos] = last
+            self._ele_to_pos[self._undecorate(last)] = pos
+            self._fix(pos)
+
+    def _fix(self, pos):
+        # Restore the min-max heap invariant after the entry at pos has been replaced.
+        # If _push_up moves the new entry away, the entry that takes its place comes from an
+        # ancestor and may need to move down instead.
+        self._push_up(pos)
+        self._push_down(pos)
+
+    def _swap(self, pos_a, pos_b):
+        heap = self._heap_of_decs
+        heap[pos_a], heap[pos_b] = heap[pos_b], heap[pos_a]
+        self._ele_to_pos[self._undecorate(heap[pos_a])] = pos_a
+        self._ele_to_pos[self._undecorate(heap[pos_b])] = pos_b
+
+    def _push_up(self, pos):
+        if pos == 0:
+            return
+        heap = self._heap_of_decs
+        parent_pos = (pos - 1) >> 1
+        if _is_min_level(pos):
+            if heap[parent_pos] < heap[pos]:
+                self._swap(pos, parent_pos)
+                self._push_up_level(parent_pos, is_min=False)
+            else:
+                self._push_up_level(pos, is_min=True)
+        else:
+            if heap[pos] < heap[parent_pos]:
+                self._swap(pos, parent_pos)
+                self._push_up_level(parent_pos, is_min=True)
+            else:
+                self._push_up_level(pos, is_min=False)
+
+    def _push_up_level(self, pos, is_min):
+        # Move the entry at pos up through the grandparents, which are on the same kind of level.
+        heap = self._heap_of_decs
+        while pos > 2:
+            grandparent_pos = (pos - 3) >> 2
+            if is_min:
+                out_of_order = heap[pos] < heap[grandparent_pos]
+            else:
+                out_of_order = heap[grandparent_pos] < heap[pos]
+            if not out_of_order:
+                break
+            self._swap(pos, grandparent_pos)
+            pos = grandparent_pos
+
+    def _push_down(self, pos):
+        heap = self._heap_of_decs
+        end = len(heap)
+        is_min = _is_min_level(pos)
+        while 1:
+            # Find the smallest (on min levels) or largest (on max levels) child or grandchild.
+            first_child = 2*pos + 1
+            if first_child >= end:
+                return
+            candidates = [first_child, first_child + 1, 4*pos + 3, 4*pos + 4, 4*pos + 5, 4*pos + 6]
+            best = first_child
+            for cand in candidates[1:]:
+                if cand < end and ((heap[cand] < heap[best]) if is_min else (heap[best] < heap[cand])):
+                    best = cand
+            if is_min:
+                out_of_order = heap[best] < heap[pos]
+            else:
+                out_of_order = heap[pos] < heap[best]
+            if not out_of_order:
+                return
+            self._swap(pos, best)
+            if best <= first_child + 1:
+                # A child; it's on the opposite kind of level, so its subtree is in order.
+                return
+            parent_pos = (best - 1) >> 1
+            if (heap[parent_pos] < heap[best]) if is_min else (heap[best] < heap[parent_pos]):
+                self._swap(best, parent_pos)
+            pos = best
+
+    def __len__(self):
+        return len(self._heap_of_decs)
+
+    def __iter__(self):
+        # A min-max heap can't be walked in order like a binary heap, but it's bounded in size.
+        return map(self._undecorate, sorted(self._heap_of_decs))
+
+    def iter_ordered(self):
+        """!
+        @brief Iterate over the elements in priority order.  The same as iterating over the BoundedHeapSet.
+        """
+        return iter(self)
+
+    def __contains__(self, ele):
+        return ele in self._ele_to_pos
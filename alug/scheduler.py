@@ -0,0 +1,84 @@
+import time
+from .heapset import HeapSet
+
+
+class DeadlineScheduler:
+    """!
+    @brief Timer queue: items with deadlines, that can be cancelled and rescheduled.
+
+    Built on HeapSet.  Cancelled and rescheduled items leave dead entries in the heap, which are
+    compacted away lazily as determined by 'compact_threshold'; see HeapSet.
+    """
+    def __init__(self, compact_threshold=0.5):
+        """!
+        @param[in] compact_threshold	Passed on to HeapSet.
+        """
+        # Every item is pushed with its deadline as explicit priority, so no key function is needed.
+        self._heapset = HeapSet([], compact_threshold=compact_threshold)
+
+    def schedule(self, item, when):
+        """!
+        @brief Schedule a hashable item to become due at time 'when'.
+        Raises KeyError if the item is already scheduled.
+        """
+        self._heapset.push(item, priority=when)
+
+    def cancel(self, item):
+        """!
+        @brief Unschedule an item.  Does nothing if the item isn't scheduled.
+        """
+        self._heapset.discard(item)
+
+    def reschedule(self, item, when):
+        """!
+        @brief Move the deadline of a scheduled item to 'when'.
+        Raises KeyError if the item isn't scheduled.
+        """
+        self._heapset.set_priority(item, when)
+
+    def deadline(self, item):
+        """!
+        @brief The time at which a scheduled item becomes due.
+        """
+        return self._heapset.priority(item)
+
+    def next_deadline(self):
+        """!
+        @return the earliest deadline of any scheduled item, or None if nothing is scheduled.
+        """
+        if not self._heapset:
+            return None
+        return self._heapset.priority(self._heapset.peek())
+
+    def pop_due(self, now=None):
+        """!
+        @brief Unschedule and return all items with a deadline at or before 'now'.
+        @param[in] now	The current time; defaults to time.monotonic().
+        @return list of the due items, in deadline order.  Items with the same deadline are returned
+                in the order they were scheduled or rescheduled.
+        """
+        if now is None:
+            now = time.monotonic()
+        heapset = self._heapset
+        due = []
+        while heapset:
+            item = heapset.peek()
+            if heapset.priority(item) > now:
+                break
+            due.append(heapset.pop())
+        return due
+
+    def __len__(self):
+        return len(self._heapset)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __contains__(self, item):
+        return item in self._heapset
+
+    def __iter__(self):
+        """!
+        @brief Iterate over the scheduled items in deadline order.
+        """
+        return iter(self._heapset)
@@ -1,170 +1,1304 @@
-import random, operator
-from .heapset import HeapSet
+import random, operator, heapq, array, time, itertools, csv, mmap, os, collections.abc
+from .heapset import HeapSet, CountingHeapSet
 
 
 class CycleError(ValueError):
     pass
 
-class _TopoNode:
-    __slots__ = ['ix', 'ins', 'outs', 'label']
-    def __init__(self, ix, label):
-        self.ix = ix
-        self.label = label
-        self.ins = set()
-        self.outs = set()
-    def __lt__(self, other):
-        return self.ix < other.ix
-    def __eq__(self, other):
-        return self.ix == other.ix
-    def __hash__(self):
-        return self.ix
-    def __repr__(self):
-        if self.ins is None:
-            return '<Node %s (dead)>' % (self.label,)
+
+# The number of edges at which _Graph first drops duplicates while reading the constraints.
+_DEDUP_MIN_EDGES = 1 << 22
+
+
+def _next_dedup_limit(limit, n_kept):
+    # Having deduplicated 'limit' edges down to n_kept, the number of edges to deduplicate at next.
+    # Few repeats means that the input is probably free of them, and further passes would only cost
+    # time; the remaining duplicates are left to _build_csr.
+    if n_kept * 4 > limit * 3:
+        return -1
+    return max(limit, 4 * n_kept)
+
+
+class _Graph:
+    """!
+    @brief Constraint graph with the items interned to integer ids, and the edges in compressed
+    sparse row form.
+
+    The id of an item is its index in the input order, so comparing ids compares input positions.
+    The out-neighbours of node v are out_adj[out_start[v]:out_start[v+1]], and likewise for in_adj.
+    Duplicate edges and self-loops are dropped.
+    """
+    def __init__(self, items, partial_order):
+        """!
+        @param[in] items		An iterable of hashable elements.
+        @param[in] partial_order	Iterable of (before,after) pairs of elements of 'items'.
+        """
+        self.labels, label_to_id = _intern(items)
+        self.label_to_id = label_to_id
+
+        self.n = len(self.labels)
+        srcs = array.array('l')
+        dsts = array.array('l')
+        # Duplicates are dropped whenever the edges read so far reach 'limit', so that memory use
+        # follows the number of distinct edges rather than the length of the input.
+        limit = _DEDUP_MIN_EDGES
+        for src,dst in partial_order:
+            s_id = label_to_id[src]
+            d_id = label_to_id[dst]
+            if s_id != d_id:
+                srcs.append(s_id)
+                dsts.append(d_id)
+                if len(srcs) == limit:
+                    srcs, dsts = _dedup_edges(self.n, srcs, dsts)
+                    limit = _next_dedup_limit(limit, len(srcs))
+        self._build_csr(srcs, dsts)
+
+    @classmethod
+    def from_pairs(cls, partial_order):
+        """!
+        @brief Make a _Graph of the items mentioned in partial_order, numbered in order of first mention.
+        """
+        graph = cls.__new__(cls)
+        label_to_id = dict()
+        srcs = array.array('l')
+        dsts = array.array('l')
+        limit = _DEDUP_MIN_EDGES
+        for src,dst in partial_order:
+            s_id = label_to_id.setdefault(src, len(label_to_id))
+            d_id = label_to_id.setdefault(dst, len(label_to_id))
+            if s_id != d_id:
+                srcs.append(s_id)
+                dsts.append(d_id)
+                if len(srcs) == limit:
+                    srcs, dsts = _dedup_edges(len(label_to_id), srcs, dsts)
+                    limit = _next_dedup_limit(limit, len(srcs))
+        graph.labels = list(label_to_id)
+        graph.label_to_id = label_to_id
+        graph.n = len(label_to_id)
+        graph._build_csr(srcs, dsts)
+        return graph
+
+    @classmethod
+    def from_csr(cls, n, out_start, out_adj, in_start, in_adj):
+        """!
+        @brief Make a _Graph with node ids range(n) and no labels, from ready-made CSR arrays.
+        """
+        graph = cls.__new__(cls)
+        graph.labels = None
+        graph.label_to_id = None
+        graph.n = n
+        graph.n_edges = len(out_adj)
+        graph.out_start = out_start
+        graph.out_adj = out_adj
+        graph.in_start = in_start
+        graph.in_adj = in_adj
+        graph.out_degree = array.array('l', map(operator.sub, out_start[1:], out_start))
+        graph.in_degree = array.array('l', map(operator.sub, in_start[1:], in_start))
+        return graph
+
+    def _build_csr(self, srcs, dsts):
+        # The edges are srcs[i] -> dsts[i], possibly with duplicates, but without self-loops.
+        n = self.n
+        out_start, out_adj = _dedup_rows(n, *_group_by(n, srcs, dsts))
+        del srcs, dsts
+        self.out_start = out_start
+        self.out_adj = out_adj
+        self.out_degree = array.array('l', map(operator.sub, out_start[1:], out_start))
+        self.n_edges = len(out_adj)
+        out_srcs = array.array('l', itertools.chain.from_iterable(map(itertools.repeat, range(n), self.out_degree)))
+        self.in_start, self.in_adj = _group_by(n, out_adj, out_srcs)
+        self.in_degree = array.array('l', map(operator.sub, self.in_start[1:], self.in_start))
+
+    def subgraph(self, ids):
+        """!
+        @brief The subgraph induced by the nodes ids, renumbered as range(len(ids)), and without labels.
+        @param[in] ids	List of distinct node ids.  An entry of None adds an unconnected node.
+        """
+        local = array.array('l', [-1]) * self.n
+        for no,v in enumerate(ids):
+            if v is not None:
+                local[v] = no
+        is_kept = (-1).__lt__
+
+        def restricted(adj, start):
+            sub_start = array.array('l', [0])
+            sub_adj = array.array('l')
+            for v in ids:
+                if v is not None:
+                    sub_adj.extend(filter(is_kept, map(local.__getitem__, adj[start[v]:start[v+1]])))
+                sub_start.append(len(sub_adj))
+            return sub_start, sub_adj
+
+        out_start, out_adj = restricted(self.out_adj, self.out_start)
+        in_start, in_adj = restricted(self.in_adj, self.in_start)
+        return _Graph.from_csr(len(ids), out_start, out_adj, in_start, in_adj)
+
+    def outs(self, v):
+        return self.out_adj[self.out_start[v]:self.out_start[v+1]]
+
+    def ins(self, v):
+        return self.in_adj[self.in_start[v]:self.in_start[v+1]]
+
+
+def _intern(items):
+    """!
+    @brief Number the items by input position.
+    @return tuple of the list of distinct items, and a dict mapping each item to its index in that list.
+    """
+    items = list(items)
+    label_to_id = { label:no for no,label in enumerate(items) }
+    if len(label_to_id) == len(items):
+        return items, label_to_id
+    # Duplicate items; the last occurrence decides the position.
+    labels = sorted(label_to_id, key=label_to_id.__getitem__)
+    return labels, { label:no for no,label in enumerate(labels) }
+
+
+def _group_by(n, keys, values):
+    """!
+    @brief Counting sort of values by keys, which are in range(n).
+    @return tuple of start and grouped arrays: the values with key k, in input order, are
+            grouped[start[k]:start[k+1]].
+    """
+    counts = array.array('l', bytes(n * array.array('l').itemsize))
+    for k in keys:
+        counts[k] += 1
+    start = _prefix_sums(counts)
+    fill = counts
+    fill[:] = start[:-1]
+    grouped = array.array('l', bytes(len(values) * counts.itemsize))
+    for k,v in zip(keys, values):
+        grouped[fill[k]] = v
+        fill[k] += 1
+    return start, grouped
+
+
+def _dedup_rows(n, start, adj):
+    """!
+    @brief Drop the repeats within each row of a CSR adjacency, keeping the first of each.
+    @return tuple of the new start and adj arrays.
+    """
+    if not len(adj):
+        return start, adj
+    deduped_adj = array.array('l')
+    deduped_start = array.array('l', [0])
+    for v in range(n):
+        deduped_adj.extend(dict.fromkeys(adj[start[v]:start[v+1]]))
+        deduped_start.append(len(deduped_adj))
+    return deduped_start, deduped_adj
+
+
+def _dedup_edges(n, srcs, dsts):
+    """!
+    @brief Drop repeated edges from the parallel arrays srcs and dsts, of node ids in range(n).
+    @return tuple of new srcs and dsts arrays, grouped by source.
+
+    For each source, the destinations keep the order of their first occurrence, so adding more
+    edges afterwards and building the graph gives the same graph as building it from all the edges.
+    """
+    start, adj = _dedup_rows(n, *_group_by(n, srcs, dsts))
+    degrees = map(operator.sub, start[1:], start)
+    return array.array('l', itertools.chain.from_iterable(map(itertools.repeat, range(n), degrees))), adj
+
+
+def _prefix_sums(counts):
+    res = array.array('l', [0])
+    total = 0
+    for count in counts:
+        total += count
+        res.append(total)
+    return res
+
+
+class _DeltaBuckets:
+    """!
+    @brief Node ids bucketed by out-degree minus in-degree, as in Eades, Lin, and Smyth [1993].
+
+    pop returns a node with the largest difference, and among those the lowest id.
+    Each bucket is a heap of ids.  When a node moves to another bucket, its entry in the old bucket
+    is left behind and skipped by pop, so a move costs a single heappush.
+    """
+    def __init__(self, out_degree, in_degree):
+        n = len(out_degree)
+        self._delta = array.array('l', (out_degree[v] - in_degree[v] for v in range(n)))
+        self._present = bytearray(b'\x01') * n
+        self._count = n
+        self._buckets = dict()
+        for v,delta in enumerate(self._delta):
+            self._buckets.setdefault(delta, []).append(v)
+        # Ids were appended in increasing order, so each bucket is already a heap.
+        self._max_delta = max(self._buckets, default=0)
+
+    def change(self, v, change):
+        """!
+        @brief Adjust the degree difference of node v by 'change'.
+        """
+        delta = self._delta[v] + change
+        self._delta[v] = delta
+        try:
+            bucket = self._buckets[delta]
+        except KeyError:
+            bucket = self._buckets[delta] = []
+        heapq.heappush(bucket, v)
+        if delta > self._max_delta:
+            self._max_delta = delta
+
+    def discard(self, v):
+        if self._present[v]:
+            self._present[v] = 0
+            self._count -= 1
+
+    def pop(self):
+        # _max_delta only goes up by one per change, so the total scanning is linear.
+        present = self._present
+        while 1:
+            bucket = self._buckets.get(self._max_delta)
+            while bucket:
+                v = heapq.heappop(bucket)
+                if present[v] and self._delta[v] == self._max_delta:
+                    self.discard(v)
+                    return v
+            self._max_delta -= 1
+
+    def __bool__(self):
+        return self._count > 0
+
+
+class _CountingDeltaBuckets(_DeltaBuckets):
+    """!
+    @brief _DeltaBuckets that counts entries, for the stats of _peel.
+    """
+    def __init__(self, out_degree, in_degree):
+        super().__init__(out_degree, in_degree)
+        self.entries = len(out_degree)
+        self.pops = 0
+
+    def change(self, v, change):
+        super().change(v, change)
+        self.entries += 1
+
+    def pop(self):
+        self.pops += 1
+        return super().pop()
+
+    def stale_skipped(self):
+        return self.entries - self.pops - sum(map(len, self._buckets.values()))
+
+
+def _add_stats(stats, **counts):
+    # Counts add up over several calls, except peaks, which are maxed.
+    for name,count in counts.items():
+        if name.endswith('_peak'):
+            stats[name] = max(stats.get(name, 0), count)
         else:
-            return '<Node %s: in=%r,out=%r>' % (self.label,len(self.ins),len(self.outs))
+            stats[name] = stats.get(name, 0) + count
 
 
-def semi_topological_sort(items, partial_order):
+def _peel(graph, break_cycles, stats=None):
+    """!
+    @brief The sorting algorithm shared by stable_topological_sort and semi_topological_sort.
+    @param[in] graph		A _Graph.
+    @param[in] break_cycles	If false, raise CycleError on cycles, otherwise break them using _DeltaBuckets.
+    @param[in] stats		If not None, a dict that counts of the work done are added to.
+    @return list of node ids in sorted order.
+
+    Repeatedly removes the lowest-id source, placing it next from the left, or failing that, the
+    highest-id sink, placing it next from the right.
+    """
+    lstack = []
+    rstack = []
+    n = graph.n
+    in_adj, in_start = graph.in_adj, graph.in_start
+    out_adj, out_start = graph.out_adj, graph.out_start
+    # Degrees counting only the nodes that haven't been placed yet.
+    ins = array.array('l', graph.in_degree)
+    outs = array.array('l', graph.out_degree)
+    alive = bytearray(b'\x01') * n
+
+    # The counting classes are only used when stats are wanted, so the loop below is the same either way.
+    heap_class = HeapSet if stats is None else CountingHeapSet
+    source_heap = heap_class([v for v in range(n) if ins[v]==0])
+    # Negated ids, so that the highest id pops first.
+    sink_heap = heap_class([-v for v in range(n) if outs[v]==0])
+
+    # If there is a cycle, this is how we pick an arbitrary node to go first:
+    # Prefer the node with the most outputs relative to inputs, since placing it first breaks the
+    # fewest constraints.
+    # Failing that, abide by the original order.
+    source_candidates = None
+    if break_cycles:
+        source_candidates = (_DeltaBuckets if stats is None else _CountingDeltaBuckets)(outs, ins)
+
+    def disconnect(v):
+        alive[v] = 0
+        for u in in_adj[in_start[v]:in_start[v+1]]:
+            if alive[u]:
+                outs[u] -= 1
+                if source_candidates is not None:
+                    source_candidates.change(u, -1)
+                if outs[u]==0:
+                    sink_heap.push(-u)
+        for w in out_adj[out_start[v]:out_start[v+1]]:
+            if alive[w]:
+                ins[w] -= 1
+                if source_candidates is not None:
+                    source_candidates.change(w, +1)
+                if ins[w]==0:
+                    source_heap.push(w)
+        source_heap.discard(v)
+        sink_heap.discard(-v)
+        if source_candidates is not None:
+            source_candidates.discard(v)
+
+    remaining = n
+    while remaining:
+        if source_heap:
+            v = source_heap.pop()
+            lstack.append(v)
+
+        elif sink_heap:
+            v = -sink_heap.pop()
+            rstack.append(v)
+
+        elif break_cycles:
+            v = source_candidates.pop()
+            lstack.append(v)
+
+        else:
+            raise CycleError
+
+        disconnect(v)
+        remaining -= 1
+
+    if stats is not None:
+        cycle_breaks = 0 if source_candidates is None else source_candidates.pops
+        _add_stats(stats,
+                   placed_as_source=len(lstack) - cycle_breaks,
+                   placed_as_sink=len(rstack),
+                   placed_by_cycle_breaking=cycle_breaks,
+                   heap_stale_skipped=source_heap.stale_skipped + sink_heap.stale_skipped,
+                   heap_key_calls=source_heap.key_calls + sink_heap.key_calls,
+                   heap_len_peak=max(source_heap.peak_len, sink_heap.peak_len),
+                   candidates_stale_skipped=0 if source_candidates is None else source_candidates.stale_skipped())
+    rstack.reverse()
+    return lstack + rstack
+
+
+def _strongly_connected_components(graph):
+    """!
+    @brief Tarjan's algorithm, with an explicit stack instead of recursion.
+    @return (comp, n_comps): comp[v] is the component number of node v.
+    """
+    n = graph.n
+    out_adj, out_start = graph.out_adj, graph.out_start
+    index = array.array('l', [-1]) * n
+    lowlink = array.array('l', [0]) * n
+    comp = array.array('l', [-1]) * n
+    on_stack = bytearray(n)
+    stack = []
+    next_index = 0
+    n_comps = 0
+    for root in range(n):
+        if index[root] >= 0:
+            continue
+        index[root] = lowlink[root] = next_index
+        next_index += 1
+        stack.append(root)
+        on_stack[root] = 1
+        # The simulated call stack: the node being visited and its next out-edge to follow.
+        call_nodes = [root]
+        call_edges = [out_start[root]]
+        while call_nodes:
+            v = call_nodes[-1]
+            edge = call_edges[-1]
+            if edge < out_start[v+1]:
+                call_edges[-1] = edge + 1
+                w = out_adj[edge]
+                if index[w] < 0:
+                    index[w] = lowlink[w] = next_index
+                    next_index += 1
+                    stack.append(w)
+                    on_stack[w] = 1
+                    call_nodes.append(w)
+                    call_edges.append(out_start[w])
+                elif on_stack[w] and index[w] < lowlink[v]:
+                    lowlink[v] = index[w]
+            else:
+                call_nodes.pop()
+                call_edges.pop()
+                if call_nodes and lowlink[v] < lowlink[call_nodes[-1]]:
+                    lowlink[call_nodes[-1]] = lowlink[v]
+                if lowlink[v] == index[v]:
+                    while 1:
+                        w = stack.pop()
+                        on_stack[w] = 0
+                        comp[w] = n_comps
+                        if w == v:
+                            break
+                    n_comps += 1
+    return comp, n_comps
+
+
+def _peel_by_components(graph, stats=None):
+    """!
+    @brief Like _peel(graph, break_cycles=True), but only breaks cycles within strongly connected components.
+    @param[in] stats		As for _peel.  The components of one node count as placed as sources.
+    @return list of node ids in sorted order.
+
+    The condensation DAG is sorted as by stable_topological_sort, with each component positioned
+    by its first node in input order, and each non-trivial component is then sorted separately.
+    """
+    comp, n_comps = _strongly_connected_components(graph)
+    members = [[] for _ in range(n_comps)]
+    for v in range(graph.n):
+        members[comp[v]].append(v)
+    # Renumber the components in order of their first member.
+    members.sort()
+    for c,group in enumerate(members):
+        for v in group:
+            comp[v] = c
+
+    out_adj, out_start = graph.out_adj, graph.out_start
+    condensation = _Graph(range(n_comps),
+                          ((comp[v], comp[w]) for v in range(graph.n)
+                           for w in out_adj[out_start[v]:out_start[v+1]] if comp[v] != comp[w]))
+    res = []
+    condensation_stats = None if stats is None else dict()
+    for c in _peel(condensation, break_cycles=False, stats=condensation_stats):
+        group = members[c]
+        if len(group) == 1:
+            res.append(group[0])
+        else:
+            subgraph = _Graph(group,
+                              ((v, w) for v in group
+                               for w in out_adj[out_start[v]:out_start[v+1]] if comp[w] == c))
+            res.extend(group[v] for v in _peel(subgraph, break_cycles=True, stats=stats))
+    if stats is not None:
+        # The condensation is a DAG, so every component was placed as a source.
+        _add_stats(stats,
+                   components=n_comps,
+                   placed_as_source=sum(len(group) == 1 for group in members),
+                   placed_as_sink=0,
+                   placed_by_cycle_breaking=0,
+                   candidates_stale_skipped=0,
+                   heap_stale_skipped=condensation_stats['heap_stale_skipped'],
+                   heap_key_calls=condensation_stats['heap_key_calls'],
+                   heap_len_peak=condensation_stats['heap_len_peak'])
+    return res
+
+
+def _violated_edges(graph, order):
+    """!
+    @brief The edges (v,w) of graph that have w before v in order, which is a list of node ids.
+    @return list of (v,w) pairs, in order of the position of v and then w.
+    """
+    pos = array.array('l', bytes(graph.n * array.array('l').itemsize))
+    for p,v in enumerate(order):
+        pos[v] = p
+    out_adj, out_start = graph.out_adj, graph.out_start
+    res = []
+    for v in order:
+        back = [w for w in out_adj[out_start[v]:out_start[v+1]] if pos[w] < pos[v]]
+        back.sort(key=pos.__getitem__)
+        res.extend((v, w) for w in back)
+    return res
+
+
+def _refine(graph, order, deadline):
+    """!
+    @brief Reduce the number of violated edges in order by sifting, until no single move helps or
+    time.monotonic() passes deadline.
+
+    Each node with a violated edge is tried at every position between its leftmost and rightmost
+    neighbour, and moved to the position that violates the fewest edges, if that is strictly
+    better than where it is.  Nodes are only moved for a strict gain, so an order without
+    violated edges is left alone, and the number of violated edges never increases.
+    @param[in,out] order	list of node ids; modified in place.
+    """
+    n = graph.n
+    out_adj, out_start = graph.out_adj, graph.out_start
+    in_adj, in_start = graph.in_adj, graph.in_start
+    pos = array.array('l', bytes(n * array.array('l').itemsize))
+    for p,v in enumerate(order):
+        pos[v] = p
+    improved = True
+    while improved:
+        improved = False
+        candidates = set()
+        for v,w in _violated_edges(graph, order):
+            candidates.add(v)
+            candidates.add(w)
+        for v in sorted(candidates, key=pos.__getitem__):
+            if time.monotonic() >= deadline:
+                return
+            succs = set(out_adj[out_start[v]:out_start[v+1]])
+            preds = set(in_adj[in_start[v]:in_start[v+1]])
+            neighbour_pos = [pos[u] for u in succs] + [pos[u] for u in preds]
+            p = pos[v]
+            best_gain, best_pos = 0, p
+            # Moving v to just before order[q] changes the violation count by 'delta'.
+            delta = 0
+            for q in range(p-1, min(neighbour_pos)-1, -1):
+                u = order[q]
+                if u in preds:
+                    delta += 1
+                elif u in succs:
+                    delta -= 1
+                if delta < best_gain:
+                    best_gain, best_pos = delta, q
+            delta = 0
+            for q in range(p+1, max(neighbour_pos)+1):
+                u = order[q]
+                if u in succs:
+                    delta += 1
+                elif u in preds:
+                    delta -= 1
+                if delta < best_gain:
+                    best_gain, best_pos = delta, q
+            if best_pos != p:
+                del order[p]
+                order.insert(best_pos, v)
+                for q in range(min(p, best_pos), max(p, best_pos)+1):
+                    pos[order[q]] = q
+                improved = True
+
+
+def semi_topological_sort(items, partial_order, scc=False, refine_seconds=None, return_violations=False, stats=None):
     """!
     @brief Cycle-tolerant stable-ish topological sort.
     @param[in] items		An iterable of hashable elements to sort.
-    @param[in] partial_order	List of (before,after) dependencies prescribing that the 'before' node should
-                                precede the 'after' node in the result.
-    @return list of items in the specified order.
+    @param[in] partial_order	Iterable of (before,after) dependencies prescribing that the 'before' node should
+                                precede the 'after' node in the result.  It is read once, and may be an
+                                iterator, such as read_edge_file returns.
+    @param[in] scc		If true, find the strongly connected components first, and only apply the
+                                cycle-breaking heuristic within those.
+    @param[in] refine_seconds	If not None, spend up to this many seconds moving items around to reduce
+                                the number of violated constraints.
+    @param[in] return_violations	If true, also return the violated constraints.
+    @param[in] stats		If not None, a dict that timings and counts are added to; see README.rst.
+    @return list of items in the specified order, or if return_violations is set, a tuple of that
+            list and a list of the (before,after) constraints that the order violates.
 
     If there are no cycles in partial_order, then a topological ordering is returned.
     If there are cycles, then a good approximation to a topological ordering is returned.
+    With scc set, all constraints between different strongly connected components are satisfied,
+    which is faster when the cycles are confined to small parts of a large graph.
+    Refinement moves one item at a time to wherever it violates the fewest constraints, and stops
+    when no such move helps or the time is up; it never makes the result worse.
 
     Based on https://stackoverflow.com/questions/57293426/topological-sort-with-loops
     which is based on: Eades, Lin, and Smyth [1993]: 'A fast and effective heuristic for the feedback arc set problem'.
     """
-    lstack = []
-    rstack = []
+    if stats is None:
+        return _semi_sort(_Graph(items, partial_order), scc, refine_seconds, return_violations)
+    t0 = time.perf_counter()
+    graph = _Graph(items, partial_order)
+    _add_stats(stats, build_seconds=time.perf_counter() - t0)
+    return _semi_sort(graph, scc, refine_seconds, return_violations, stats)
 
-    label_to_node = { label:_TopoNode(no, label) for no,label in enumerate(items) }
+def _semi_sort(graph, scc, refine_seconds, return_violations, stats=None):
+    labels = graph.labels
+    if stats is not None:
+        _add_stats(stats, nodes=graph.n, edges=graph.n_edges)
+        t0 = time.perf_counter()
+    if scc:
+        order = _peel_by_components(graph, stats)
+    else:
+        order = _peel(graph, break_cycles=True, stats=stats)
+    if stats is not None:
+        t1 = time.perf_counter()
+        _add_stats(stats, sort_seconds=t1 - t0)
+    if refine_seconds is not None:
+        _refine(graph, order, time.monotonic() + refine_seconds)
+        if stats is not None:
+            _add_stats(stats, refine_seconds=time.perf_counter() - t1)
+    res = [labels[v] for v in order]
+    if return_violations:
+        return res, [(labels[v], labels[w]) for v,w in _violated_edges(graph, order)]
+    return res
 
-    for src,dst in partial_order:
-        s_node = label_to_node[src]
-        d_node = label_to_node[dst]
-        if s_node is not d_node:
-            s_node.outs.add(d_node)
-            d_node.ins.add(s_node)
+def stable_topological_sort(items, partial_order, stats=None):
+    """!
+    @brief Stable-ish topological sort.
+    @param[in] items		An iterable of hashable elements to sort.
+    @param[in] partial_order	Iterable of (before,after) dependencies prescribing that the 'before' node should
+                                precede the 'after' node in the result.  It is read once, and may be an
+                                iterator, such as read_edge_file returns.
+    @param[in] stats		If not None, a dict that timings and counts are added to; see README.rst.
+    @return list of items in the specified order.
 
-    nodes = set(label_to_node.values())
-    sources = set(node for node in nodes if len(node.ins)==0)
-    sinks = set(node for node in nodes if len(node.outs)==0)
+    Based on https://stackoverflow.com/questions/57293426/topological-sort-with-loops
+    which is based on: Eades, Lin, and Smyth [1993]: 'A fast and effective heuristic for the feedback arc set problem'.
+    """
+    if stats is None:
+        graph = _Graph(items, partial_order)
+        labels = graph.labels
+        return [labels[v] for v in _peel(graph, break_cycles=False)]
+    t0 = time.perf_counter()
+    graph = _Graph(items, partial_order)
+    t1 = time.perf_counter()
+    _add_stats(stats, build_seconds=t1 - t0, nodes=graph.n, edges=graph.n_edges)
+    try:
+        order = _peel(graph, break_cycles=False, stats=stats)
+    finally:
+        _add_stats(stats, sort_seconds=time.perf_counter() - t1)
+    labels = graph.labels
+    return [labels[v] for v in order]
 
-    source_heap = HeapSet(sources)
-    sink_heap = HeapSet(sinks, key=lambda node: -node.ix)
+def numpy_topological_sort(edges=None, n=None, items=None, semi=False, *, before=None, after=None):
+    """!
+    @brief Topological sort of integer items, with the constraints given as NumPy arrays.
+    @param[in] edges	An array of shape (E,2) of (before,after) rows, or anything that converts to one,
+                        such as a list of pairs.
+    @param[in] n	The items are range(n).  Defaults to one more than the largest item in 'edges'.
+    @param[in] items	Instead of 'n', an array of distinct integer items, in input order.
+    @param[in] semi	If true, sort like semi_topological_sort, otherwise like stable_topological_sort.
+    @param[in] before, after	Instead of 'edges', the constraints as two index arrays of length E.
+    @return NumPy array of the items in sorted order.
 
-    # If there is a cycle, this is how we pick an arbitrary node to go first:
-    # Prefer nodes with more inputs and outputs, since removing such a node has a better chance of
-    # breaking cycles.
-    # Failing that, abide by the original order (.ix).
-    source_candidate_heap = HeapSet(nodes, key=lambda n: (-(len(n.ins)+len(n.outs)), n.ix))
-
-    def disconnect(node):
-        for in_node in node.ins:
-            in_node.outs.discard(node)
-            source_candidate_heap.recompute_key(node)
-            if len(in_node.outs)==0:
-                sink_heap.push(in_node)
-        for out_node in node.outs:
-            out_node.ins.discard(node)
-            source_candidate_heap.recompute_key(node)
-            if len(out_node.ins)==0:
-                source_heap.push(out_node)
-        source_heap.discard(node)
-        sink_heap.discard(node)
-        source_candidate_heap.discard(node)
-        
-        node.ins = None
-        node.outs = None
-        nodes.discard(node)
-
-    while True:
-        if source_heap:
-            inode = source_heap.pop()
-            disconnect(inode)
-            lstack.append(inode)
-            source_candidate_heap.discard(inode)
+    Gives the same result as stable_topological_sort or semi_topological_sort with the same items
+    and constraints, but deduplicates edges, counts degrees and builds the graph with vectorised
+    operations, without going through Python tuples.
+    """
+    import numpy
 
-        elif sink_heap:
-            anode = sink_heap.pop()
-            disconnect(anode)
-            rstack.append(anode)
-            source_candidate_heap.discard(anode)
+    if (edges is None) == (before is None and after is None):
+        raise TypeError("give either 'edges', or 'before' and 'after'")
+    if n is not None and items is not None:
+        raise TypeError("give either 'n' or 'items', not both")
+    if edges is None:
+        if before is None or after is None:
+            raise TypeError("give both 'before' and 'after'")
+        before = numpy.asarray(before, dtype=numpy.int64).ravel()
+        after = numpy.asarray(after, dtype=numpy.int64).ravel()
+        if len(before) != len(after):
+            raise ValueError("'before' and 'after' differ in length")
+    else:
+        edges = numpy.asarray(edges, dtype=numpy.int64).reshape(-1, 2)
+        before = edges[:,0]
+        after = edges[:,1]
+    if items is None:
+        if len(before) and min(before.min(), after.min()) < 0:
+            raise KeyError('negative item in edges')
+        largest = max(before.max(initial=-1), after.max(initial=-1))
+        if n is None:
+            n = int(largest) + 1
+        elif largest >= n:
+            raise KeyError('item %d in edges is not in range(n)' % largest)
+        items = numpy.arange(n, dtype=numpy.int64)
+        s_ids = before
+        d_ids = after
+    else:
+        items = numpy.asarray(items, dtype=numpy.int64).ravel()
+        n = len(items)
+        # Look the labels up by binary search in the sorted items, so that memory use does not
+        # depend on how large the labels are.
+        sorter = numpy.argsort(items, kind='stable')
+        sorted_items = items[sorter]
+        if numpy.any(sorted_items[1:] == sorted_items[:-1]):
+            raise ValueError('duplicate items')
+
+        def to_ids(labels):
+            pos = numpy.searchsorted(sorted_items, labels)
+            if len(labels) and (n == 0 or not numpy.array_equal(sorted_items[numpy.minimum(pos, n-1)], labels)):
+                raise KeyError('edge refers to an item that is not in items')
+            return sorter[pos]
+        s_ids = to_ids(before)
+        d_ids = to_ids(after)
+
+    # Same edge encoding as _Graph; numpy.unique both deduplicates and groups by source.
+    keep = s_ids != d_ids
+    codes = numpy.unique(s_ids[keep] * n + d_ids[keep])
+    s_ids = codes // n
+    d_ids = codes % n
+    by_dst = numpy.argsort(d_ids, kind='stable')
+    out_start = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(s_ids, minlength=n))))
+    in_start = numpy.concatenate(([0], numpy.cumsum(numpy.bincount(d_ids, minlength=n))))
+
+    def to_array(arr):
+        return array.array('l', arr.tolist())
+    graph = _Graph.from_csr(n, to_array(out_start), to_array(d_ids), to_array(in_start), to_array(s_ids[by_dst]))
+    order = _peel(graph, break_cycles=semi)
+    return items[numpy.array(order, dtype=numpy.int64)]
+
+
+def _weakly_connected_components(graph):
+    """!
+    @brief Find the weakly connected components by union-find.
+    @return list of components, each a list of node ids in increasing order, ordered by their
+            lowest id.
+    """
+    n = graph.n
+    parent = array.array('l', range(n))
+    size = array.array('l', [1]) * n
+
+    def find(v):
+        while parent[v] != v:
+            # Path halving.
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+
+    out_adj, out_start = graph.out_adj, graph.out_start
+    for v in range(n):
+        outs = out_adj[out_start[v]:out_start[v+1]]
+        if not outs:
+            continue
+        root_v = find(v)
+        for w in outs:
+            root_w = parent[w]
+            if parent[root_w] != root_w:
+                root_w = find(root_w)
+            if root_v != root_w:
+                if size[root_v] < size[root_w]:
+                    root_v, root_w = root_w, root_v
+                parent[root_w] = root_v
+                size[root_v] += size[root_w]
+
+    root_to_members = dict()
+    for v in range(n):
+        root = find(v)
+        try:
+            root_to_members[root].append(v)
+        except KeyError:
+            root_to_members[root] = [v]
+    # Dicts keep insertion order, which is by lowest member.
+    return list(root_to_members.values())
+
+
+def _sort_component(n, out_start, out_adj, in_start, in_adj, semi, scc):
+    # Runs in a worker process, so it takes and returns plain arrays.
+    graph = _Graph.from_csr(n, out_start, out_adj, in_start, in_adj)
+    if semi and scc:
+        return array.array('l', _peel_by_components(graph))
+    return array.array('l', _peel(graph, break_cycles=semi))
 
-        elif source_candidate_heap:
-            inode = source_candidate_heap.pop()
-            disconnect(inode)
-            lstack.append(inode)
-            source_candidate_heap.discard(inode)
 
+def _merge_orders(orders):
+    """!
+    @brief Merge lists of distinct node ids, repeatedly taking the lowest of the lists' next ids.
+
+    The lists are not sorted, so this is not heapq.merge; the relative order within each list is
+    kept.
+    """
+    positions = [0] * len(orders)
+    heap = [(order[0], i) for i,order in enumerate(orders) if order]
+    heapq.heapify(heap)
+    res = []
+    while heap:
+        v, i = heap[0]
+        res.append(v)
+        order = orders[i]
+        pos = positions[i] = positions[i] + 1
+        if pos < len(order):
+            heapq.heapreplace(heap, (order[pos], i))
         else:
-            break
+            heapq.heappop(heap)
+    return res
 
-    return [node.label for node in lstack + rstack[::-1]]
 
-def stable_topological_sort(items, partial_order):
+def split_topological_sort(items, partial_order, semi=False, scc=False, executor=None, min_parallel_size=10000):
     """!
-    @brief Stable-ish topological sort.
+    @brief Topological sort that sorts each weakly connected component separately.
     @param[in] items		An iterable of hashable elements to sort.
-    @param[in] partial_order	List of (before,after) dependencies prescribing that the 'before' node should
+    @param[in] partial_order	Iterable of (before,after) dependencies prescribing that the 'before' node should
                                 precede the 'after' node in the result.
+    @param[in] semi		If false, sort as stable_topological_sort, otherwise as semi_topological_sort.
+    @param[in] scc		As for semi_topological_sort.
+    @param[in] executor		If not None, a concurrent.futures.ProcessPoolExecutor to sort the large
+                                components on.
+    @param[in] min_parallel_size	The number of items from which a component is sorted on the executor,
+                                        rather than in this process.
     @return list of items in the specified order.
 
-    Based on https://stackoverflow.com/questions/57293426/topological-sort-with-loops
-    which is based on: Eades, Lin, and Smyth [1993]: 'A fast and effective heuristic for the feedback arc set problem'.
+    The result is the same as from stable_topological_sort, when semi is false.  When semi is true,
+    each component is ordered as semi_topological_sort would order it alone.  The components are
+    then merged, placing next whichever component's next item comes first in input order.
     """
-    lstack = []
-    rstack = []
+    graph = _Graph(items, partial_order)
+    labels = graph.labels
+    components = _weakly_connected_components(graph)
+    # The position of each node within its component.  As all edges are within components, this
+    # renumbers the edges of a component without any need to filter them, unlike _Graph.subgraph.
+    local = array.array('l', bytes(graph.n * array.array('l').itemsize))
+    for component in components:
+        for no,v in enumerate(component):
+            local[v] = no
 
-    label_to_node = { label:_TopoNode(no, label) for no,label in enumerate(items) }
-
-    for src,dst in partial_order:
-        s_node = label_to_node[src]
-        d_node = label_to_node[dst]
-        if s_node is not d_node:
-            s_node.outs.add(d_node)
-            d_node.ins.add(s_node)
-
-    nodes = set(label_to_node.values())
-    sources = set(node for node in nodes if len(node.ins)==0)
-    sinks = set(node for node in nodes if len(node.outs)==0)
-
-    source_heap = HeapSet(sources)
-    sink_heap = HeapSet(sinks, key=lambda node: -node.ix)
-
-    def disconnect(node):
-        for in_node in node.ins:
-            in_node.outs.discard(node)
-            if len(in_node.outs)==0:
-                sink_heap.push(in_node)
-        for out_node in node.outs:
-            out_node.ins.discard(node)
-            if len(out_node.ins)==0:
-                source_heap.push(out_node)
-        source_heap.discard(node)
-        sink_heap.discard(node)
-
-        node.ins = None
-        node.outs = None
-        nodes.discard(node)
-
-    while nodes:
-        if source_heap:
-            inode = source_heap.pop()
-            disconnect(inode)
-            lstack.append(inode)
+    def renumbered(component, adj, start):
+        sub_start = array.array('l', [0])
+        sub_adj = array.array('l')
+        for v in component:
+            sub_adj.extend(map(local.__getitem__, adj[start[v]:start[v+1]]))
+            sub_start.append(len(sub_adj))
+        return sub_start, sub_adj
 
-        elif sink_heap:
-            anode = sink_heap.pop()
-            disconnect(anode)
-            rstack.append(anode)
+    futures = []
+    orders = []
+    for component in components:
+        if len(component) == 1:
+            orders.append(component)
+            continue
+        args = ((len(component),) + renumbered(component, graph.out_adj, graph.out_start)
+                + renumbered(component, graph.in_adj, graph.in_start) + (semi, scc))
+        if executor is not None and len(component) >= min_parallel_size:
+            futures.append((len(orders), component, executor.submit(_sort_component, *args)))
+            orders.append(None)
+        else:
+            orders.append([component[v] for v in _sort_component(*args)])
+    for ix,component,future in futures:
+        orders[ix] = [component[v] for v in future.result()]
+    return [labels[v] for v in _merge_orders(orders)]
+
+
+def _critical_path_lengths(graph, costs):
+    """!
+    @brief For every node, the largest total cost of a path from it to a sink, counting both ends.
+    @param[in] costs	List of the cost of each node.
+    @return list of path lengths.
+
+    Nodes are visited sinks first, in one pass over the edges.  CycleError is raised if there is a cycle.
+    """
+    in_adj, in_start = graph.in_adj, graph.in_start
+    out_adj, out_start = graph.out_adj, graph.out_start
+    outs = array.array('l', graph.out_degree)
+    lengths = list(costs)
+    stack = [v for v in range(graph.n) if outs[v]==0]
+    visited = 0
+    while stack:
+        v = stack.pop()
+        visited += 1
+        if out_start[v] != out_start[v+1]:
+            lengths[v] += max(map(lengths.__getitem__, out_adj[out_start[v]:out_start[v+1]]))
+        for u in in_adj[in_start[v]:in_start[v+1]]:
+            outs[u] -= 1
+            if outs[u]==0:
+                stack.append(u)
+    if visited != graph.n:
+        raise CycleError
+    return lengths
+
+
+def critical_path_topological_sort(items, partial_order, cost=None):
+    """!
+    @brief Topological sort that puts the items on the longest chains first.
+    @param[in] items		An iterable of hashable elements to sort.
+    @param[in] partial_order	Iterable of (before,after) dependencies prescribing that the 'before' node should
+                                precede the 'after' node in the result.
+    @param[in] cost		Function giving the cost of an item, such as its expected run time.
+                                If None, every item costs 1.
+    @return list of items in topological order.
+
+    Whenever several items have all their 'before' items placed, the one with the costliest path
+    to the end goes next, and among equals, the one that comes first in input order.  This is the
+    critical path list scheduling heuristic: when the result is worked through by several workers,
+    the long chains start early, which shortens the total time.
+    CycleError is raised if there is a cycle.
+    """
+    graph = _Graph(items, partial_order)
+    labels = graph.labels
+    costs = [1] * graph.n if cost is None else list(map(cost, labels))
+    lengths = _critical_path_lengths(graph, costs)
+
+    out_adj, out_start = graph.out_adj, graph.out_start
+    ins = array.array('l', graph.in_degree)
+    source_heap = HeapSet([v for v in range(graph.n) if ins[v]==0], key=lambda v: (-lengths[v], v))
+    res = []
+    while source_heap:
+        v = source_heap.pop()
+        res.append(labels[v])
+        for w in out_adj[out_start[v]:out_start[v+1]]:
+            ins[w] -= 1
+            if ins[w]==0:
+                source_heap.push(w)
+    return res
+
+
+def iter_topological_sort(items, partial_order):
+    """!
+    @brief Topological sort that yields items as soon as their position is known.
+    @param[in] items		An iterable of hashable elements to sort.
+    @param[in] partial_order	Iterable of (before,after) dependencies prescribing that the 'before' node should
+                                precede the 'after' node in the result.  It is read once, and may be an
+                                iterator, such as read_edge_file returns.
+    @return iterator of items in topological order.
+
+    Each item yielded is the earliest item in input order whose 'before' items have all been
+    yielded, so the first items are available as soon as the graph is built.  On acyclic input the
+    result is the same as from stable_topological_sort, which on such input always has a source to
+    place next.  The only difference is that CycleError is raised after the items that precede the
+    cycle have been yielded, instead of before anything is returned.
+    """
+    graph = _Graph(items, partial_order)
+    labels = graph.labels
+    out_adj, out_start = graph.out_adj, graph.out_start
+    ins = array.array('l', graph.in_degree)
+    source_heap = [v for v in range(graph.n) if ins[v]==0]
+    placed = 0
+    while source_heap:
+        v = heapq.heappop(source_heap)
+        yield labels[v]
+        placed += 1
+        for w in out_adj[out_start[v]:out_start[v+1]]:
+            ins[w] -= 1
+            if ins[w]==0:
+                heapq.heappush(source_heap, w)
+    if placed < graph.n:
+        raise CycleError
+
+
+def _generations(graph, rank=None):
+    """!
+    @brief Kahn's algorithm, level by level.
+    @param[in] graph	A _Graph.
+    @param[in] rank	Optional array of node positions; constraints going backwards in rank are ignored.
+    @return iterator of lists of node ids, each in increasing order.
+    Raises CycleError when no further progress is possible.
+    """
+    n = graph.n
+    out_adj, out_start = graph.out_adj, graph.out_start
+    if rank is None:
+        ins = array.array('l', graph.in_degree)
+    else:
+        ins = array.array('l', bytes(n * graph.in_degree.itemsize))
+        for v in range(n):
+            for w in out_adj[out_start[v]:out_start[v+1]]:
+                if rank[v] < rank[w]:
+                    ins[w] += 1
+    level = [v for v in range(n) if ins[v]==0]
+    placed = 0
+    while level:
+        yield level
+        placed += len(level)
+        next_level = []
+        for v in level:
+            for w in out_adj[out_start[v]:out_start[v+1]]:
+                if rank is None or rank[v] < rank[w]:
+                    ins[w] -= 1
+                    if ins[w]==0:
+                        next_level.append(w)
+        next_level.sort()
+        level = next_level
+    if placed < n:
+        raise CycleError
+
+
+def _labelled_generations(graph, generations):
+    labels = graph.labels
+    for level in generations:
+        yield [labels[v] for v in level]
+
+
+def stable_topological_generations(items, partial_order):
+    """!
+    @brief Topological sort into generations of items that can be processed concurrently.
+    @param[in] items		An iterable of hashable elements to sort.
+    @param[in] partial_order	Iterable of (before,after) dependencies prescribing that the 'before' node should
+                                precede the 'after' node in the result.  It is read once, and may be an
+                                iterator, such as read_edge_file returns.
+    @return iterator of lists of items.
+
+    The first generation holds the items that have no 'before' items, and each following generation
+    holds the items whose 'before' items are all in earlier generations.  Within a generation, items
+    are in input order.
+    CycleError is raised, after the generations that precede the cycle, if there is a cycle.
+    """
+    graph = _Graph(items, partial_order)
+    return _labelled_generations(graph, _generations(graph))
+
+
+def semi_topological_generations(items, partial_order, scc=False):
+    """!
+    @brief Cycle-tolerant counterpart of stable_topological_generations.
+    @param[in] items		An iterable of hashable elements to sort.
+    @param[in] partial_order	Iterable of (before,after) dependencies.
+    @param[in] scc		As for semi_topological_sort.
+    @return iterator of lists of items.
+
+    The constraints that semi_topological_sort would violate are dropped, and the rest are split
+    into generations as by stable_topological_generations.
+    """
+    graph = _Graph(items, partial_order)
+    order = _peel_by_components(graph) if scc else _peel(graph, break_cycles=True)
+    rank = array.array('l', bytes(graph.n * graph.in_degree.itemsize))
+    for no,v in enumerate(order):
+        rank[v] = no
+    return _labelled_generations(graph, _generations(graph, rank))
+
+
+class _SequenceView(collections.abc.Sequence):
+    """!
+    @brief Read-only view of a list, following changes to it.
+    """
+    def __init__(self, seq):
+        self._seq = seq
+
+    def __getitem__(self, ix):
+        return self._seq[ix]
+
+    def __len__(self):
+        return len(self._seq)
+
+    def __iter__(self):
+        return iter(self._seq)
+
+    def __contains__(self, item):
+        return item in self._seq
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self._seq)
+
+
+class TopoOrder:
+    """!
+    @brief A topological order that is kept up to date as constraints are added and removed.
+
+    Uses the dynamic topological sort algorithm of Pearce and Kelly [2006]: 'A dynamic topological
+    sort algorithm for directed acyclic graphs'.  Adding a constraint that the current order already
+    satisfies is O(1).  Otherwise only the items positioned between the two ends of the new
+    constraint, and reachable from them, are reordered.
+    """
+    def __init__(self, items=(), partial_order=()):
+        """!
+        @param[in] items		An iterable of hashable elements.
+        @param[in] partial_order	Initial (before,after) constraints.
+        The initial order is the one given by stable_topological_sort; CycleError is raised if the
+        constraints have a cycle.
+        """
+        partial_order = list(partial_order)
+        self._order = stable_topological_sort(items, partial_order)
+        self._pos = { item:no for no,item in enumerate(self._order) }
+        self._outs = { item:set() for item in self._order }
+        self._ins = { item:set() for item in self._order }
+        for before,after in partial_order:
+            if before != after:
+                self._outs[before].add(after)
+                self._ins[after].add(before)
+
+    def add(self, item):
+        """!
+        @brief Add an unconstrained item at the end of the order.
+        Raises KeyError if the item is already present.
+        """
+        if item in self._pos:
+            raise KeyError('already in order')
+        self._pos[item] = len(self._order)
+        self._order.append(item)
+        self._outs[item] = set()
+        self._ins[item] = set()
+
+    def remove(self, item):
+        """!
+        @brief Remove an item and all its constraints.
+        This takes time proportional to the number of items positioned after it.
+        """
+        pos = self._pos.pop(item)
+        for after in self._outs.pop(item):
+            self._ins[after].discard(item)
+        for before in self._ins.pop(item):
+            self._outs[before].discard(item)
+        del self._order[pos]
+        for no in range(pos, len(self._order)):
+            self._pos[self._order[no]] = no
+
+    def add_constraint(self, before, after):
+        """!
+        @brief Require 'before' to come before 'after', reordering as needed.
+        Raises CycleError, and leaves the TopoOrder unchanged, if that isn't possible.
+        Constraining an item to come before itself is ignored, as in the sort functions.
+        """
+        pos = self._pos
+        if before == after or after in self._outs[before]:
+            return
+        lower = pos[after]
+        upper = pos[before]
+        if lower < upper:
+            # Items reachable from 'after' that are positioned no later than 'before' must move
+            # after it, and items reaching 'before' that are positioned no earlier than 'after'
+            # must move before them.
+            forward = self._reach(after, self._outs, lambda p: p <= upper)
+            if before in forward:
+                raise CycleError('%r already comes before %r' % (after, before))
+            backward = self._reach(before, self._ins, lambda p: p >= lower)
+            self._reorder(backward, forward)
+        self._outs[before].add(after)
+        self._ins[after].add(before)
+
+    def remove_constraint(self, before, after):
+        """!
+        @brief Drop a constraint.  The current order remains valid, so nothing moves.
+        """
+        self._outs[before].discard(after)
+        self._ins[after].discard(before)
+
+    def _reach(self, start, adjacency, in_region):
+        # The items reachable from start through adjacency, restricted to positions within the region.
+        pos = self._pos
+        seen = {start}
+        stack = [start]
+        while stack:
+            item = stack.pop()
+            for neighbour in adjacency[item]:
+                if neighbour not in seen and in_region(pos[neighbour]):
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        return seen
+
+    def _reorder(self, backward, forward):
+        # Place the 'backward' items before the 'forward' items, each group in its current relative
+        # order, reusing the positions that the two groups occupy between them.
+        pos = self._pos
+        moving = sorted(backward, key=pos.__getitem__) + sorted(forward, key=pos.__getitem__)
+        slots = sorted(map(pos.__getitem__, moving))
+        for item,no in zip(moving, slots):
+            pos[item] = no
+            self._order[no] = item
 
+    def position(self, item):
+        """!
+        @brief Index of the item in the current order.
+        """
+        return self._pos[item]
+
+    @property
+    def order(self):
+        """!
+        @brief The current order, as a read-only sequence of items.
+        This is a view, in O(1), that follows later changes; use list(topo.order) for a copy.
+        """
+        return _SequenceView(self._order)
+
+    def constraints(self):
+        """!
+        @brief Iterate over all current (before,after) constraints.
+        """
+        for before,outs in self._outs.items():
+            for after in outs:
+                yield (before, after)
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __contains__(self, item):
+        return item in self._pos
+
+
+def read_edge_file(path, delimiter=None, convert=None, encoding=None):
+    """!
+    @brief Read (before,after) pairs from a text file, one pair per line.
+    @param[in] path		Name of the file.
+    @param[in] delimiter	None for fields separated by whitespace, or the delimiter of a CSV file,
+                                such as ','.
+    @param[in] convert		If not None, a function applied to every field, such as int.
+    @param[in] encoding		The text encoding of the file.
+    @return iterator of pairs, read from the file as they are needed.
+
+    Blank lines, and lines that start with '#', are skipped.  ValueError is raised for a line that
+    does not have exactly two fields.
+    """
+    with open(path, encoding=encoding, newline=None if delimiter is None else '') as f:
+        if delimiter is None:
+            rows = enumerate((line.split() for line in f), 1)
         else:
-            raise CycleError
+            reader = csv.reader(f, delimiter=delimiter, skipinitialspace=True)
+            rows = ((reader.line_num, row) for row in reader)
+        for lineno,row in rows:
+            if not row or row[0].startswith('#'):
+                continue
+            if len(row) != 2:
+                raise ValueError('%s:%d: expected 2 fields, got %d' % (path, lineno, len(row)))
+            before, after = row
+            if convert is not None:
+                before, after = convert(before), convert(after)
+            yield before, after
+
+
+def read_binary_edge_file(path):
+    """!
+    @brief Read (before,after) pairs of integers from a memory-mapped binary file.
+    @param[in] path		Name of a file of int32 values in native byte order, such as written by
+                                numpy.ndarray.tofile from an (E,2) int32 array.
+    @return iterator of pairs, read from the file as they are needed.
+
+    The file is kept open until the iterator is exhausted or closed.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size % 8:
+            raise ValueError('%s: size %d is not a whole number of int32 pairs' % (path, size))
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+             memoryview(mapped) as raw, raw.cast('i') as ints, \
+             ints[0::2] as befores, ints[1::2] as afters:
+            yield from zip(befores, afters)
+
+
+class ConstraintGraph:
+    """!
+    @brief A partial order compiled once, for sorting many different sets of items against it.
+
+    The constraints are interned and deduplicated when the ConstraintGraph is made.  Each sort then
+    only hashes the items to be sorted, and restricts the compiled graph to them: constraints
+    involving an item that is not being sorted are ignored, and items that no constraint mentions
+    are unconstrained.
+    """
+    def __init__(self, partial_order):
+        """!
+        @param[in] partial_order	Iterable of (before,after) dependencies prescribing that the 'before' node
+                                        should precede the 'after' node.
+        """
+        self._graph = _Graph.from_pairs(partial_order)
+
+    def items(self):
+        """!
+        @brief All the items that constraints mention, in order of first mention.
+        """
+        return list(self._graph.labels)
+
+    def n_constraints(self):
+        """!
+        @brief The number of distinct constraints.
+        """
+        return self._graph.n_edges
+
+    def __len__(self):
+        """!
+        @brief The number of items that constraints mention.
+        """
+        return self._graph.n
+
+    def __contains__(self, item):
+        """!
+        @brief Whether any constraint mentions item.
+        """
+        return item in self._graph.label_to_id
+
+    def _restrict(self, items):
+        # The subgraph induced by items, numbered by input position as _Graph(items, ...) would be.
+        labels, label_to_id = _intern(items)
+        graph = self._graph
+        sub = graph.subgraph(list(map(graph.label_to_id.get, labels)))
+        sub.labels = labels
+        sub.label_to_id = label_to_id
+        return sub
+
+    def sort(self, items):
+        """!
+        @brief Sort items as stable_topological_sort(items, partial_order) would, with partial_order
+        restricted to items.
+        """
+        graph = self._restrict(items)
+        labels = graph.labels
+        return [labels[v] for v in _peel(graph, break_cycles=False)]
 
-    return [node.label for node in lstack + rstack[::-1]]
+    def semi_sort(self, items, scc=False, refine_seconds=None, return_violations=False):
+        """!
+        @brief Sort items as semi_topological_sort(items, partial_order, ...) would, with
+        partial_order restricted to items.
+        """
+        graph = self._restrict(items)
+        return _semi_sort(graph, scc, refine_seconds, return_violations)
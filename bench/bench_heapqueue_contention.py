@@ -0,0 +1,70 @@
+"""!
+@brief Throughput of ThreadSafeHeapSet and AsyncHeapSet under contention.
+
+Usage: python bench/bench_heapqueue_contention.py [N_threads [N_items]]
+
+N_threads producer threads push N_items elements in total, while N_threads consumer threads pop
+them.  queue.PriorityQueue and asyncio.PriorityQueue are run the same way for comparison.
+"""
+import sys, os, time, random, threading, queue, asyncio
+sys.path.insert(0, os.path.join(os.path.split(__file__)[0], '..'))
+from alug.heapset import HeapSet, IndexedHeapSet
+from alug.heapqueue import ThreadSafeHeapSet, AsyncHeapSet
+
+
+def run_threads(N_threads, items, push, pop):
+    per_thread = len(items) // N_threads
+    def produce(no):
+        for item in items[no*per_thread:(no+1)*per_thread]:
+            push(item)
+    def consume():
+        for _ in range(per_thread):
+            pop()
+    threads = [threading.Thread(target=produce, args=(no,)) for no in range(N_threads)]
+    threads += [threading.Thread(target=consume) for _ in range(N_threads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0
+
+
+async def run_tasks(N_tasks, items, push, pop):
+    per_task = len(items) // N_tasks
+    async def produce(no):
+        for ix,item in enumerate(items[no*per_task:(no+1)*per_task]):
+            push(item)
+            if ix % 64 == 0:
+                await asyncio.sleep(0)
+    async def consume():
+        for _ in range(per_task):
+            await pop()
+    t0 = time.perf_counter()
+    await asyncio.gather(*([produce(no) for no in range(N_tasks)] + [consume() for _ in range(N_tasks)]))
+    return time.perf_counter() - t0
+
+
+def report(name, N, seconds):
+    print('%-34s %10.0f items/s' % (name, N / seconds))
+
+
+def main(N_threads, N):
+    items = [(random.random(), no) for no in range(N)]
+    N = N // N_threads * N_threads
+
+    q = queue.PriorityQueue()
+    report('queue.PriorityQueue', N, run_threads(N_threads, items, q.put, q.get))
+    for heap_class in [HeapSet, IndexedHeapSet]:
+        h = ThreadSafeHeapSet(heap_class=heap_class)
+        report('ThreadSafeHeapSet(%s)' % heap_class.__name__, N, run_threads(N_threads, items, h.push, h.pop))
+
+    q = asyncio.PriorityQueue()
+    report('asyncio.PriorityQueue', N, asyncio.run(run_tasks(N_threads, items, q.put_nowait, q.get)))
+    h = AsyncHeapSet()
+    report('AsyncHeapSet(HeapSet)', N, asyncio.run(run_tasks(N_threads, items, h.push, h.pop)))
+
+
+if __name__=='__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 200000)
@@ -0,0 +1,34 @@
+"""!
+@brief Memory use of HeapSet, IndexedHeapSet and CompactHeapSet.
+
+Usage: python bench/bench_heapset_memory.py [N]
+
+Builds each heapset with N elements and float priorities, changes the priority of every element
+once, and reports the peak memory traced by tracemalloc, and the memory still held afterwards,
+per element.
+"""
+import sys, os, random, tracemalloc
+sys.path.insert(0, os.path.join(os.path.split(__file__)[0], '..'))
+from alug.heapset import HeapSet, IndexedHeapSet, CompactHeapSet
+
+
+def measure(heap_class, priorities):
+    tracemalloc.start()
+    h = heap_class(range(len(priorities)), key=priorities.__getitem__)
+    for ele in range(len(priorities)):
+        h.set_priority(ele, priorities[ele] + 1.0)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, peak
+
+
+def main(N):
+    priorities = [random.random() for _ in range(N)]
+    print('%-16s %14s %14s' % ('N=%d' % N, 'bytes/element', 'peak/element'))
+    for heap_class in [HeapSet, IndexedHeapSet, CompactHeapSet]:
+        current, peak = measure(heap_class, priorities)
+        print('%-16s %14.1f %14.1f' % (heap_class.__name__, current / N, peak / N))
+
+
+if __name__=='__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10**6)
@@ -0,0 +1,249 @@
+"""!
+@brief Benchmark suite for alug.heapset and alug.topo, with regression checks against a baseline.
+
+Usage: python bench/bench_suite.py [--min-exponent K] [--max-exponent K] [--repeat R] [--only SUBSTRING]
+                                   [--no-memory] [--baseline FILE] [--save-baseline] [--tolerance T]
+                                   [--min-seconds S]
+
+Every case is run at sizes of 10**K operations or edges, for K from --min-exponent to
+--max-exponent:
+
+ * heapset/<mix>/<class>: HeapSet, IndexedHeapSet and CompactHeapSet on a push-then-pop run
+   (against plain heapq), and on a random mix of push, pop, discard and recompute_key.
+ * topo/<graph>/<sort>: stable_topological_sort, semi_topological_sort and
+   graphlib.TopologicalSorter on random DAGs, random cyclic graphs, chains and stars.
+
+The time reported is the best of --repeat runs.  The peak memory is measured with tracemalloc in
+a separate run, as tracing slows the code down.  Results are compared with those stored in the
+baseline file, and cases that are more than --tolerance slower or larger are flagged, with exit
+status 1.  Times below --min-seconds in the baseline are too noisy to compare and are not checked.
+--save-baseline merges the results into the baseline file instead.
+"""
+import sys, os, time, random, heapq, tracemalloc, gc, json, argparse
+sys.path.insert(0, os.path.join(os.path.split(__file__)[0], '..'))
+from alug.heapset import HeapSet, IndexedHeapSet, CompactHeapSet
+from alug.topo import stable_topological_sort, semi_topological_sort
+
+try:
+    import graphlib
+except ImportError:
+    graphlib = None
+
+
+# Graph generators.  Each returns (items, edges) with about N_edges edges.
+
+def dag_graph(N_edges, rng):
+    N_items = max(N_edges // 4, 2)
+    edges = []
+    while len(edges) < N_edges:
+        a = rng.randrange(N_items)
+        b = rng.randrange(N_items)
+        if a != b:
+            edges.append((min(a,b), max(a,b)))
+    items = list(range(N_items))
+    rng.shuffle(items)
+    return items, edges
+
+def cyclic_graph(N_edges, rng):
+    N_items = max(N_edges // 4, 2)
+    edges = [(rng.randrange(N_items), rng.randrange(N_items)) for _ in range(N_edges)]
+    items = list(range(N_items))
+    rng.shuffle(items)
+    return items, edges
+
+def chain_graph(N_edges, rng):
+    # Items in reverse order, so that the sort has to turn the whole input around.
+    return list(range(N_edges, -1, -1)), [(i, i+1) for i in range(N_edges)]
+
+def star_graph(N_edges, rng):
+    # One hub before everything else, listed last.
+    return list(range(1, N_edges+1)) + [0], [(0, i) for i in range(1, N_edges+1)]
+
+GRAPHS = [('dag', dag_graph, True), ('cyclic', cyclic_graph, False),
+          ('chain', chain_graph, True), ('star', star_graph, True)]
+
+
+def graphlib_sort(items, edges):
+    sorter = graphlib.TopologicalSorter()
+    for item in items:
+        sorter.add(item)
+    for before,after in edges:
+        sorter.add(after, before)
+    return list(sorter.static_order())
+
+
+# HeapSet workloads.  Setup makes the input, outside of the timing.
+
+def push_pop_setup(N, rng):
+    return [rng.random() for _ in range(N)]
+
+def push_pop_heapset(heap_class):
+    def run(priorities):
+        h = heap_class([], key=priorities.__getitem__)
+        for ele in range(len(priorities)):
+            h.push(ele)
+        for _ in range(len(priorities)):
+            h.pop()
+    return run
+
+def push_pop_heapq(priorities):
+    heap = []
+    for ele,prio in enumerate(priorities):
+        heapq.heappush(heap, (prio, ele))
+    for _ in range(len(priorities)):
+        heapq.heappop(heap)
+
+PUSH, POP, DISCARD, RECOMPUTE = range(4)
+
+def mixed_setup(N, rng):
+    # 40% push, 30% pop, 15% discard and 15% recompute_key.  Discard and recompute_key target a
+    # random element pushed earlier, which may have left the heap already.
+    ops = []
+    N_pushed = 0
+    for _ in range(N):
+        r = rng.random()
+        if r < 0.4 or N_pushed == 0:
+            ops.append((PUSH, N_pushed, rng.random()))
+            N_pushed += 1
+        elif r < 0.7:
+            ops.append((POP, None, None))
+        elif r < 0.85:
+            ops.append((DISCARD, rng.randrange(N_pushed), None))
+        else:
+            ops.append((RECOMPUTE, rng.randrange(N_pushed), rng.random()))
+    return ops, N_pushed
+
+def mixed_heapset(heap_class):
+    def run(setup):
+        ops, N_pushed = setup
+        priorities = [0.0] * N_pushed
+        h = heap_class([], key=priorities.__getitem__)
+        for op,ele,prio in ops:
+            if op == PUSH:
+                priorities[ele] = prio
+                h.push(ele)
+            elif op == POP:
+                if h:
+                    h.pop()
+            elif op == DISCARD:
+                h.discard(ele)
+            else:
+                priorities[ele] = prio
+                h.recompute_key(ele)
+    return run
+
+
+def cases(exponents):
+    """!
+    @brief Generate (name, setup, run) for all benchmark cases, where run(setup()) does the timed work.
+    """
+    heap_classes = [HeapSet, IndexedHeapSet, CompactHeapSet]
+    for k in exponents:
+        N = 10**k
+        size = '1e%d' % k
+        for mix, setup, runs in [
+                ('push_pop', push_pop_setup,
+                 [('heapq', push_pop_heapq)] + [(c.__name__, push_pop_heapset(c)) for c in heap_classes]),
+                ('mixed', mixed_setup,
+                 [(c.__name__, mixed_heapset(c)) for c in heap_classes])]:
+            make_input = lambda setup=setup, N=N, seed=k: setup(N, random.Random(seed))
+            for impl, run in runs:
+                yield 'heapset/%s/%s/%s' % (mix, impl, size), make_input, run
+        for graph_name, generator, acyclic in GRAPHS:
+            setup = lambda generator=generator, N=N, seed=k: generator(N, random.Random(seed))
+            sorts = [('semi_topological_sort', lambda g: semi_topological_sort(*g))]
+            if acyclic:
+                sorts.insert(0, ('stable_topological_sort', lambda g: stable_topological_sort(*g)))
+                if graphlib is not None:
+                    sorts.append(('graphlib', lambda g: graphlib_sort(*g)))
+            for impl, run in sorts:
+                yield 'topo/%s/%s/%s' % (graph_name, impl, size), setup, run
+
+
+def measure(data, run, repeat, memory):
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        run(data)
+        best = min(best, time.perf_counter() - t0)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        run(data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peak
+
+
+def ratio(new, old):
+    return new / old if new is not None and old else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1][8:])
+    parser.add_argument('--min-exponent', type=int, default=3)
+    parser.add_argument('--max-exponent', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', default='', help='only run cases with names containing this')
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory measurement')
+    parser.add_argument('--baseline', default=os.path.join(os.path.split(__file__)[0], 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-seconds', type=float, default=0.01,
+                        help='only check the time of cases that took at least this long in the baseline')
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = dict()
+
+    results = dict()
+    # Cases on the same input come in a row; keep the input until it changes.
+    last_setup = data = None
+    regressions = []
+    print('%-52s %10s %10s %8s %8s' % ('case', 'seconds', 'peak MB', 'time', 'memory'))
+    for name, setup, run in cases(range(args.min_exponent, args.max_exponent+1)):
+        if args.only not in name:
+            continue
+        if setup is not last_setup:
+            last_setup = data = None
+            data = setup()
+            last_setup = setup
+        seconds, peak = measure(data, run, args.repeat, not args.no_memory)
+        results[name] = dict(seconds=seconds, peak_bytes=peak)
+        old = baseline.get(name, dict())
+        time_ratio = ratio(seconds, old.get('seconds'))
+        if time_ratio is not None and old['seconds'] < args.min_seconds:
+            time_ratio = None
+        memory_ratio = ratio(peak, old.get('peak_bytes'))
+        flag = ''
+        if any(r is not None and r > 1 + args.tolerance for r in [time_ratio, memory_ratio]):
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-52s %10.4f %10s %8s %8s%s' % (
+            name, seconds, '-' if peak is None else '%.1f' % (peak / 2**20),
+            '-' if time_ratio is None else '%.2fx' % time_ratio,
+            '-' if memory_ratio is None else '%.2fx' % memory_ratio, flag))
+        sys.stdout.flush()
+
+    if args.save_baseline:
+        for name, result in results.items():
+            if result['peak_bytes'] is None and name in baseline:
+                result['peak_bytes'] = baseline[name].get('peak_bytes')
+            baseline[name] = result
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('Saved %d results to %s' % (len(results), args.baseline))
+        return 0
+    if regressions:
+        print('%d regressions against %s' % (len(regressions), args.baseline))
+        return 1
+    return 0
+
+
+if __name__=='__main__':
+    sys.exit(main())
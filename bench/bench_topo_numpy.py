@@ -0,0 +1,39 @@
+"""!
+@brief numpy_topological_sort compared with the tuple-list path.
+
+Usage: python bench/bench_topo_numpy.py [N_items [N_edges]]
+
+Sorts a random DAG of N_items integer items and N_edges constraints, with
+stable_topological_sort on a list of tuples, and with numpy_topological_sort on an (E,2) array.
+"""
+import sys, os, time
+sys.path.insert(0, os.path.join(os.path.split(__file__)[0], '..'))
+import numpy
+from alug.topo import stable_topological_sort, semi_topological_sort, numpy_topological_sort
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return time.perf_counter() - t0, res
+
+
+def main(N_items, N_edges):
+    rng = numpy.random.default_rng(1)
+    ends = rng.integers(0, N_items, size=(N_edges, 2))
+    dag = numpy.sort(ends, axis=1)
+    items = list(range(N_items))
+
+    for name, edges, tuple_sort, semi in [('DAG', dag, stable_topological_sort, False),
+                                          ('cyclic', ends, semi_topological_sort, True)]:
+        pairs = list(map(tuple, edges.tolist()))
+        t_tuples, res_tuples = timed(tuple_sort, items, pairs)
+        t_numpy, res_numpy = timed(numpy_topological_sort, edges, n=N_items, semi=semi)
+        assert res_numpy.tolist() == res_tuples
+        print('%-8s %-28s %8.2fs' % (name, tuple_sort.__name__, t_tuples))
+        print('%-8s %-28s %8.2fs  (%.1fx)' % (name, 'numpy_topological_sort', t_numpy, t_tuples / t_numpy))
+
+
+if __name__=='__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10**5,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10**6)
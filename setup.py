@@ -13,6 +13,9 @@ setup(
     author_email='ajm@flonidan.dk',
     license='MIT',
     packages=['alug'],
+    extras_require={
+        'numpy': ['numpy'],
+        },
     classifiers=[
         # 'Development Status :: 5 - Production/Stable',
         'Development Status :: 4 - Beta',
@@ -28,4 +31,4 @@ setup(
         'License :: OSI Approved :: BSD License',
         ],
     keywords='algorithms datastructures topological sort heap set heapset priority queue',
-)
\ No newline at end of file
+)
\ No newline at end of file
@@ -0,0 +1,126 @@
+import unittest, random, sys, os
+sys.path.insert(0, os.path.join(os.path.split(__file__)[0], '..'))
+from alug.heapset import HeapSet
+from alug.bucketqueue import BucketQueue
+
+
+class Test_BucketQueue(unittest.TestCase):
+    def test_basic(self):
+        q = BucketQueue(['ccc', 'a', 'bb', 'b', 'aaa'], key=len)
+        self.assertEqual(len(q), 5)
+        self.assertEqual(list(q), ['a', 'b', 'bb', 'ccc', 'aaa'])
+        self.assertEqual(q.peek(), 'a')
+        self.assertEqual(q.pop(), 'a')
+        q.discard('b')
+        q.discard('b')
+        self.assertRaises(KeyError, q.__delitem__, 'b')
+        self.assertRaises(KeyError, q.push, 'bb')
+        q.push('dd')
+        self.assertIn('dd', q)
+        self.assertEqual(list(q.pop_all()), ['bb', 'dd', 'ccc', 'aaa'])
+        self.assertFalse(q)
+        self.assertRaises(IndexError, q.pop)
+
+    def test_monotone(self):
+        q = BucketQueue([5, 10])
+        self.assertEqual(q.pop(), 5)
+        q.push(5)
+        self.assertRaises(ValueError, q.push, 4)
+        self.assertEqual(list(q.pop_all()), [5, 10])
+
+    def test_recompute_key_below_last_popped(self):
+        prio = {'a': 1, 'b': 2}
+        q = BucketQueue(prio, key=prio.__getitem__)
+        self.assertEqual(q.pop(), 'a')
+        prio['b'] = 0
+        self.assertRaises(ValueError, q.recompute_key, 'b')
+        self.assertEqual(q.pop(), 'b')
+
+    def test_explicit_priority(self):
+        def key(ele):
+            raise AssertionError('key function called')
+        q = BucketQueue([], key=key)
+        q.push('a', priority=3)
+        q.push('b', priority=1)
+        q.set_priority('a', 0)
+        self.assertEqual(q.priority('a'), 0)
+        self.assertEqual(q.priority('b'), 1)
+        self.assertRaises(KeyError, q.set_priority, 'c', 1)
+        self.assertEqual(q.pop(), 'a')
+        self.assertRaises(ValueError, q.set_priority, 'b', -1)
+        self.assertEqual(q.priority('b'), 1)
+        self.assertEqual(q.pop(), 'b')
+
+    def test_wide_gaps(self):
+        q = BucketQueue([10**12, 3, 10**6])
+        self.assertEqual(list(q.pop_all()), [3, 10**6, 10**12])
+
+    def test_many_wide_gaps(self):
+        # Widely spaced priorities, pushed in random order and interleaved with pops.
+        priorities = [ix * 1000 + random.randrange(1000) for ix in range(20000)]
+        shuffled = list(priorities)
+        random.shuffle(shuffled)
+        q = BucketQueue(shuffled[:10000])
+        popped = [q.pop() for _ in range(5000)]
+        for prio in shuffled[10000:]:
+            if prio >= popped[-1]:
+                q.push(prio)
+        popped.extend(q.pop_all())
+        self.assertEqual(popped, sorted(popped))
+        self.assertEqual(set(popped), set(p for p in shuffled[:10000]) | set(p for p in shuffled[10000:] if p >= popped[4999]))
+
+    def test_reused_priorities(self):
+        # Buckets emptied and made again, without pops.
+        q = BucketQueue([])
+        for ele in range(1000):
+            q.push(ele, priority=10**9 + ele % 3)
+            if ele % 2:
+                q.discard(ele)
+        self.assertLessEqual(len(q._prio_heap), 2 * 3 + 17)
+        self.assertEqual(list(q.pop_all()), [e for p in range(3) for e in range(0, 1000, 2) if e % 3 == p])
+
+    def test_iter_snapshot(self):
+        q = BucketQueue(['ccc', 'a', 'bb', 'b'], key=len)
+        for ele in q:
+            q.discard(ele)
+        self.assertEqual(len(q), 0)
+        q = BucketQueue(['ccc', 'a', 'bb', 'b'], key=len)
+        self.assertEqual(list(q.iter_ordered()), list(q))
+        self.assertEqual(q.nsmallest(3), ['a', 'b', 'bb'])
+
+    def test_random_against_HeapSet(self):
+        # Property test: with monotone priorities, BucketQueue and HeapSet agree exactly.
+        for _ in range(20):
+            prio = dict()
+            ref = HeapSet([], key=prio.__getitem__)
+            q = BucketQueue([], key=prio.__getitem__)
+            last_popped = 0
+            for _ in range(500):
+                x = random.randrange(40)
+                op = random.randrange(4)
+                if op == 0:
+                    self.assertEqual(x in q, x in ref)
+                    if x not in ref:
+                        prio[x] = last_popped + random.randrange(8)
+                        ref.push(x)
+                        q.push(x)
+                elif op == 1:
+                    ref.discard(x)
+                    q.discard(x)
+                elif op == 2:
+                    if x in ref:
+                        prio[x] = last_popped + random.randrange(8)
+                    ref.recompute_key(x)
+                    q.recompute_key(x)
+                elif ref:
+                    self.assertEqual(q.peek(), ref.peek())
+                    ele = q.pop()
+                    self.assertEqual(ele, ref.pop())
+                    last_popped = prio[ele]
+                self.assertEqual(len(q), len(ref))
+            self.assertEqual(list(q), list(ref))
+            self.assertEqual(list(q.pop_all()), list(ref.pop_all()))
+
+
+if __name__=='__main__':
+    unittest.main()
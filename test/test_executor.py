@@ -0,0 +1,77 @@
+import unittest, random, threading, time, concurrent.futures, sys, os
+sys.path.insert(0, os.path.join(os.path.split(__file__)[0], '..'))
+from alug.executor import run_topologically
+from alug.topo import stable_topological_sort, semi_topological_sort, critical_path_topological_sort, CycleError
+
+
+class Test_run_topologically(unittest.TestCase):
+    def _run(self, elements, conditions, **kwargs):
+        lock = threading.Lock()
+        log = []
+        def fn(item):
+            with lock:
+                log.append(('start', item))
+            time.sleep(random.random() * 0.001)
+            with lock:
+                log.append(('end', item))
+            return item * 10
+        results = run_topologically(elements, conditions, fn, **kwargs)
+        return results, log
+
+    def test_single_worker_follows_stable_order(self):
+        elements = [5, 1, 4, 2, 3]
+        conditions = [(1,2), (2,3), (3,4)]
+        results, log = self._run(elements, conditions, max_workers=1)
+        order = stable_topological_sort(elements, conditions)
+        self.assertEqual(list(results), order)
+        self.assertEqual(list(results.values()), [item * 10 for item in order])
+        self.assertEqual([item for what,item in log if what == 'start'], order)
+
+    def test_single_worker_follows_critical_path_order(self):
+        elements = [5, 1, 4, 2, 3]
+        conditions = [(1,2), (2,3)]
+        cost = {1: 1, 2: 1, 3: 1, 4: 1, 5: 10}
+        results, log = self._run(elements, conditions, max_workers=1, cost=cost.__getitem__)
+        self.assertEqual(list(results), stable_topological_sort(elements, conditions))
+        self.assertEqual([item for what,item in log if what == 'start'],
+                         critical_path_topological_sort(elements, conditions, cost=cost.__getitem__))
+
+    def test_random(self):
+        for _ in range(10):
+            N_ele = random.randrange(1, 40)
+            elements = list(range(N_ele))
+            random.shuffle(elements)
+            conditions = [(random.randrange(N_ele), random.randrange(N_ele)) for _ in range(N_ele)]
+            conditions = [(min(a,b), max(a,b)) for a,b in conditions]
+            results, log = self._run(elements, conditions, max_workers=4)
+            self.assertEqual(sorted(results), sorted(elements))
+            when = dict((entry, no) for no,entry in enumerate(log))
+            for a,b in conditions:
+                if a != b:
+                    self.assertLess(when[('end', a)], when[('start', b)])
+
+    def test_cycles(self):
+        self.assertRaises(CycleError, run_topologically, [1,2], [(1,2),(2,1)], str)
+        results = run_topologically([1,2,3], [(1,2),(2,1),(3,1)], str, cycles='break', max_workers=1)
+        self.assertEqual(list(results), semi_topological_sort([1,2,3], [(1,2),(2,1),(3,1)]))
+        self.assertRaises(ValueError, run_topologically, [1], [], str, cycles='ignore')
+
+    def test_max_workers(self):
+        with concurrent.futures.ThreadPoolExecutor(2) as executor:
+            for max_workers in [0, -1]:
+                self.assertRaises(ValueError, run_topologically, [1], [], str, executor=executor,
+                                  max_workers=max_workers)
+                self.assertRaises(ValueError, run_topologically, [1], [], str, max_workers=max_workers)
+
+    def test_exception(self):
+        called = []
+        def fn(item):
+            called.append(item)
+            if item == 2:
+                raise RuntimeError('failed')
+        self.assertRaises(RuntimeError, run_topologically, [1,2,3,4], [(2,3),(3,4)], fn, max_workers=1)
+        self.assertEqual(called, [1,2])
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest, asyncio, threading, functools, sys, os
+sys.path.insert(0, os.path.join(os.path.split(__file__)[0], '..'))
+from alug.heapset import HeapSet, IndexedHeapSet, CompactHeapSet, BoundedHeapSet
+from alug.bucketqueue import BucketQueue
+from alug.heapqueue import ThreadSafeHeapSet, AsyncHeapSet
+
+
+class Test_ThreadSafeHeapSet(unittest.TestCase):
+    def test_basic(self):
+        for heap_class in [HeapSet, IndexedHeapSet, CompactHeapSet, BucketQueue]:
+            h = ThreadSafeHeapSet([5, 3, 8], heap_class=heap_class)
+            h.push(1)
+            h.push_many([2, 9])
+            h.discard(8)
+            self.assertIn(9, h)
+            self.assertEqual(len(h), 5)
+            self.assertEqual(list(h), [1, 2, 3, 5, 9])
+            self.assertEqual(h.pop(), 1)
+            self.assertEqual(list(h.pop_all()), [2, 3, 5, 9])
+            self.assertRaises(IndexError, h.pop, block=False)
+            self.assertRaises(IndexError, h.pop, timeout=0.01)
+
+    def test_bounded(self):
+        h = ThreadSafeHeapSet([5, 3, 8], heap_class=functools.partial(BoundedHeapSet, capacity=3))
+        self.assertEqual(h.push(1), 8)
+        self.assertEqual(h.push_many([9, 2]), [9, 5])
+        self.assertEqual(list(h.pop_all()), [1, 2, 3])
+        async def main():
+            h = AsyncHeapSet([5, 3], heap_class=functools.partial(BoundedHeapSet, capacity=2))
+            evicted = h.push(1)
+            return evicted, await h.pop()
+        self.assertEqual(asyncio.run(main()), (5, 1))
+
+    def test_producers_consumers(self):
+        N_threads = 4
+        N_per_thread = 500
+        h = ThreadSafeHeapSet(key=lambda ele: ele[1])
+        popped = []
+        popped_lock = threading.Lock()
+
+        def produce(no):
+            for i in range(N_per_thread):
+                h.push((no, i))
+                if i % 3 == 0:
+                    h.discard((no, i))
+
+        def consume():
+            while 1:
+                ele = h.pop()
+                if ele[0] == 'stop':
+                    return
+                with popped_lock:
+                    popped.append(ele)
+
+        consumers = [threading.Thread(target=consume) for _ in range(N_threads)]
+        producers = [threading.Thread(target=produce, args=(no,)) for no in range(N_threads)]
+        for t in consumers + producers:
+            t.start()
+        for t in producers:
+            t.join()
+        for no in range(N_threads):
+            h.push(('stop', no), priority=N_per_thread)
+        for t in consumers:
+            t.join()
+
+        self.assertFalse(h)
+        self.assertEqual(len(popped), len(set(popped)))
+        expected = set((no, i) for no in range(N_threads) for i in range(N_per_thread) if i % 3 != 0)
+        self.assertLessEqual(expected, set(popped))
+        self.assertLessEqual(len(popped), N_threads * N_per_thread)
+
+
+class Test_AsyncHeapSet(unittest.TestCase):
+    def test_pop_waits_for_push(self):
+        async def main():
+            h = AsyncHeapSet(key=len)
+            results = []
+            async def consume():
+                while 1:
+                    ele = await h.pop()
+                    if ele == '':
+                        return
+                    results.append(ele)
+            consumer = asyncio.ensure_future(consume())
+            await asyncio.sleep(0)
+            h.push_many(['ccc', 'a'])
+            await asyncio.sleep(0)
+            h.push('bb')
+            h.discard('bb')
+            h.push('dd')
+            h.set_priority('dd', 0)
+            h.push('', priority=10)
+            await consumer
+            return results
+        self.assertEqual(asyncio.run(main()), ['a', 'ccc', 'dd'])
+
+    def test_timeout(self):
+        async def main():
+            h = AsyncHeapSet()
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(h.pop(), 0.01)
+            h.push(1)
+            self.assertEqual(await h.pop(), 1)
+            self.assertRaises(IndexError, h.pop_nowait)
+        asyncio.run(main())
+
+
+if __name__=='__main__':
+    unittest.main()
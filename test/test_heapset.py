@@ -1,6 +1,6 @@
-import unittest, random, sys, os
+import unittest, random, functools, sys, os
 sys.path.insert(0, os.path.join(os.path.split(__file__)[0], '..'))
-from alug.heapset import HeapSet
+from alug.heapset import HeapSet, IndexedHeapSet, CompactHeapSet, BoundedHeapSet, CountingHeapSet, _is_min_level
 
 
 class Test_HeapSet(unittest.TestCase):
@@ -27,6 +27,90 @@ class Test_HeapSet(unittest.TestCase):
         self.assertEqual(len(self._h), 0)
         self.assertEqual(list(self._h), [])
 
+    def test_nsmallest_and_pop_n(self):
+        for heap_class in [HeapSet, IndexedHeapSet, CompactHeapSet]:
+            h = heap_class(range(16), key=lambda n: (n%4)*256 + (n%8)*16 + n)
+            h.discard(8)
+            self.assertEqual(h.nsmallest(3), [0, 4, 12])
+            self.assertEqual(h.nsmallest(100), [0, 4, 12, 1, 9, 5, 13, 2, 10, 6, 14, 3, 11, 7, 15])
+            self.assertEqual(len(h), 15)
+            self.assertEqual(h.pop_n(4), [0, 4, 12, 1])
+            self.assertEqual(h.pop_n(0), [])
+            self.assertEqual(len(h), 11)
+            self.assertEqual(h.pop_n(20), [9, 5, 13, 2, 10, 6, 14, 3, 11, 7, 15])
+            self.assertEqual(h.pop_n(1), [])
+
+    def test_explicit_priority(self):
+        for heap_class in [HeapSet, IndexedHeapSet, CompactHeapSet]:
+            calls = []
+            def key(ele):
+                calls.append(ele)
+                return ele
+            h = heap_class([5, 3], key=key)
+            del calls[:]
+            h.push(1, priority=10)
+            h.push(2, priority=4)
+            h.set_priority(5, 0)
+            h.set_priority(2, 6)
+            self.assertRaises(KeyError, h.set_priority, 7, 1)
+            self.assertRaises(KeyError, h.push, 1, priority=2)
+            self.assertEqual(calls, [])
+            self.assertEqual([h.priority(n) for n in [1, 2, 3, 5]], [10, 6, 3, 0])
+            self.assertRaises(KeyError, h.priority, 7)
+            self.assertEqual(list(h.pop_all()), [5, 3, 2, 1])
+            self.assertEqual(calls, [])
+
+    def test_explicit_priority_without_key(self):
+        # Without a key function the elements are their own priorities, and explicit ones can be mixed in.
+        for heap_class in [HeapSet, IndexedHeapSet, CompactHeapSet, functools.partial(BoundedHeapSet, capacity=10)]:
+            h = heap_class([5, 3, 8])
+            self.assertEqual(h.priority(3), 3)
+            h.push(1, priority=10)
+            h.set_priority(8, 0)
+            h.push(4)
+            h.discard(5)
+            h.push(5)
+            self.assertEqual([h.priority(n) for n in [1, 3, 4, 5, 8]], [10, 3, 4, 5, 0])
+            self.assertEqual(list(h), [8, 3, 4, 5, 1])
+            self.assertEqual(h.nsmallest(10), [8, 3, 4, 5, 1])
+            self.assertEqual(list(h.pop_all()), [8, 3, 4, 5, 1])
+
+            h = heap_class([5, 3, 8])
+            h.set_priority(8, 0)
+            self.assertRaises(KeyError, h.set_priority, 7, 0)
+            self.assertEqual(list(h.pop_all()), [8, 3, 5])
+
+    def test_iter_ordered_pushed_again(self):
+        h = HeapSet([1, 2, 3])
+        h.discard(2)
+        h.push(2)
+        self.assertEqual(h.nsmallest(5), [1, 2, 3])
+        self.assertEqual(list(h.iter_ordered()), [1, 2, 3])
+        self.assertEqual(list(h), [1, 2, 3])
+
+    def test_iter_changed(self):
+        for heap_class in [HeapSet, IndexedHeapSet, CompactHeapSet]:
+            h = heap_class([3, 1, 2])
+            it = h.iter_ordered()
+            self.assertEqual(next(it), 1)
+            h.push(0)
+            self.assertRaises(RuntimeError, next, it)
+
+    def test_iter_snapshot(self):
+        for heap_class in [HeapSet, IndexedHeapSet, CompactHeapSet, BoundedHeapSet]:
+            prio = {3: 0}
+            kwargs = dict(capacity=10) if heap_class is BoundedHeapSet else dict()
+            h = heap_class([4, 1, 3, 2], key=lambda ele: prio.get(ele, ele), **kwargs)
+            seen = []
+            for ele in h:
+                seen.append(ele)
+                h.discard(ele)
+                h.push(ele + 10)
+            self.assertEqual(seen, [3, 1, 2, 4])
+            self.assertEqual(list(h), [11, 12, 13, 14])
+            self.assertEqual(list(h.iter_ordered()), [11, 12, 13, 14])
+            self.assertEqual(h.nsmallest(2), [11, 12])
+
     def test_discard(self):
         h = HeapSet([4,1,3,2])
         self.assertEqual(h.pop(), 1)
@@ -82,5 +166,294 @@ class Test_HeapSet(unittest.TestCase):
         h.discard(6)
         self.assertEqual(list(h), [8, 4, 10, 2, 12])
 
+    def test_peek(self):
+        h = HeapSet([4,1,3,2])
+        self.assertEqual(h.peek(), 1)
+        h.discard(1)
+        self.assertEqual(h.peek(), 2)
+        self.assertEqual(len(h), 3)
+        self.assertEqual(h.pop(), 2)
+        self.assertRaises(IndexError, HeapSet([]).peek)
+
+    def test_bulk(self):
+        for heap_class in [HeapSet, IndexedHeapSet, CompactHeapSet]:
+            for batch_size in [3, 100]:
+                prio = dict((n, n % 13) for n in range(200))
+                ref = heap_class([], key=prio.__getitem__)
+                h = heap_class([], key=prio.__getitem__)
+                for n in range(50):
+                    ref.push(n)
+                h.push_many(range(50))
+                batch = list(range(50, 50+batch_size))
+                for n in batch:
+                    ref.push(n)
+                h.push_many(batch)
+                self.assertRaises(KeyError, h.push_many, [199, 10])
+                self.assertRaises(KeyError, h.push_many, [198, 198])
+                self.assertNotIn(198, h)
+                self.assertNotIn(199, h)
+
+                batch = list(range(0, 50+batch_size, 3))
+                for n in batch:
+                    prio[n] = 13 - n % 7
+                    ref.recompute_key(n)
+                h.recompute_keys(batch)
+
+                batch = list(range(1, 50+batch_size, 2)) + [500]
+                for n in batch:
+                    ref.discard(n)
+                h.discard_many(batch)
+                self.assertEqual(len(h), len(ref))
+                self.assertEqual(list(h.pop_all()), list(ref.pop_all()))
+
+    def test_compaction(self):
+        prio = dict((n, n) for n in range(100))
+        h = HeapSet(range(100), key=prio.__getitem__)
+        for round in range(50):
+            for n in range(100):
+                prio[n] = (n * 7 + round) % 101
+                h.recompute_key(n)
+            self.assertEqual(h.live_count, 100)
+            self.assertLessEqual(h.dead_count, 100)
+        self.assertEqual(list(h.pop_all()), sorted(range(100), key=prio.__getitem__))
+
+    def test_compaction_disabled(self):
+        h = HeapSet(range(100), compact_threshold=None)
+        for n in range(90):
+            h.discard(n)
+        self.assertEqual(h.live_count, 10)
+        self.assertEqual(h.dead_count, 90)
+        h.compact()
+        self.assertEqual(h.dead_count, 0)
+        self.assertEqual(list(h), list(range(90, 100)))
+
+class Test_IndexedHeapSet(unittest.TestCase):
+    def _check_invariant(self, h):
+        heap = h._heap_of_decs
+        for pos in range(1, len(heap)):
+            self.assertFalse(heap[pos] < heap[(pos-1)//2])
+        for ele,pos in h._ele_to_pos.items():
+            self.assertEqual(h._undecorate(heap[pos]), ele)
+
+    def test_iter_and_pop_all(self):
+        h = IndexedHeapSet(range(16), key=lambda n: (n%4, n%8, n))
+        res = list(h)
+        self.assertEqual(res, [0, 8, 4, 12, 1, 9, 5, 13, 2, 10, 6, 14, 3, 11, 7, 15])
+        self.assertEqual(list(h.pop_all()), res)
+        self.assertEqual(len(h), 0)
+
+    def test_discard_and_peek(self):
+        h = IndexedHeapSet([4,1,3,2])
+        self.assertEqual(h.peek(), 1)
+        self.assertEqual(h.pop(), 1)
+        h.discard(3)
+        h.discard(3)
+        self.assertRaises(KeyError, h.__delitem__, 3)
+        self.assertEqual(h.peek(), 2)
+        self.assertEqual(list(h.pop_all()), [2, 4])
+        self.assertRaises(IndexError, h.pop)
+        self.assertRaises(IndexError, h.peek)
+
+    def test_random_against_HeapSet(self):
+        prio = dict()
+        ref = HeapSet([], key=prio.__getitem__)
+        h = IndexedHeapSet([], key=prio.__getitem__)
+        for _ in range(2000):
+            x = random.randrange(50)
+            op = random.randrange(4)
+            if op == 0:
+                self.assertEqual(x in h, x in ref)
+                if x not in ref:
+                    prio[x] = random.randrange(20)
+                    ref.push(x)
+                    h.push(x)
+                else:
+                    self.assertRaises(KeyError, h.push, x)
+            elif op == 1:
+                ref.discard(x)
+                h.discard(x)
+            elif op == 2:
+                prio[x] = random.randrange(20)
+                ref.recompute_key(x)
+                h.recompute_key(x)
+            elif ref:
+                self.assertEqual(h.peek(), ref.peek())
+                self.assertEqual(h.pop(), ref.pop())
+            self.assertEqual(len(h), len(ref))
+            self._check_invariant(h)
+        self.assertEqual(list(h.pop_all()), list(ref.pop_all()))
+
+
+class Test_CompactHeapSet(unittest.TestCase):
+    def _check_invariant(self, h):
+        heap = h._heap
+        for pos in range(1, len(heap)):
+            self.assertFalse(h._less(heap[pos], heap[(pos-1)//2]))
+        for ele,slot in h._ele_to_slot.items():
+            self.assertEqual(h._elements[slot], ele)
+            self.assertEqual(heap[h._slot_pos[slot]], slot)
+
+    def test_random_against_HeapSet(self):
+        prio = dict()
+        ref = HeapSet([], key=prio.__getitem__)
+        h = CompactHeapSet([], key=prio.__getitem__, typecode='q')
+        for _ in range(2000):
+            x = random.randrange(50)
+            op = random.randrange(5)
+            if op == 0:
+                if x not in ref:
+                    prio[x] = random.randrange(20)
+                    ref.push(x)
+                    h.push(x)
+            elif op == 1:
+                ref.discard(x)
+                h.discard(x)
+            elif op == 2:
+                prio[x] = random.randrange(20)
+                ref.recompute_key(x)
+                h.recompute_key(x)
+            elif op == 3 and x in ref:
+                p = random.randrange(20)
+                ref.set_priority(x, p)
+                h.set_priority(x, p)
+                self.assertEqual(h.priority(x), p)
+            elif ref:
+                self.assertEqual(h.peek(), ref.peek())
+                self.assertEqual(h.pop(), ref.pop())
+            self.assertEqual(len(h), len(ref))
+            self._check_invariant(h)
+        self.assertEqual(list(h), list(ref))
+        self.assertEqual(list(h.pop_all()), list(ref.pop_all()))
+
+    def test_float_priorities(self):
+        h = CompactHeapSet([2.5, -1.0, 0.25])
+        self.assertEqual(list(h), [-1.0, 0.25, 2.5])
+        self.assertRaises(TypeError, h.push, 'x')
+        self.assertNotIn('x', h)
+
+
+class Test_CountingHeapSet(unittest.TestCase):
+    def test_counts(self):
+        prio = {'a': 3, 'b': 1, 'c': 2}
+        h = CountingHeapSet(prio, key=prio.__getitem__, compact_threshold=None)
+        self.assertEqual((h.key_calls, h.stale_skipped, h.peak_len), (3, 0, 3))
+        h.discard('b')
+        prio['a'] = 0
+        h.recompute_key('a')
+        self.assertEqual((h.key_calls, h.peak_len), (4, 4))
+        self.assertEqual(h.peek(), 'a')
+        self.assertEqual(h.stale_skipped, 0)
+        h.set_priority('a', 5)
+        self.assertEqual(h.pop(), 'c')
+        # The discarded 'b' and the first entry for 'a' were skipped.
+        self.assertEqual(h.stale_skipped, 2)
+        self.assertEqual(h.pop(), 'a')
+        self.assertRaises(IndexError, h.pop)
+        self.assertEqual((h.key_calls, h.peak_len), (4, 5))
+
+    def test_random_against_HeapSet(self):
+        prio = dict()
+        ref = HeapSet([], key=prio.__getitem__)
+        h = CountingHeapSet([], key=prio.__getitem__)
+        for _ in range(2000):
+            x = random.randrange(50)
+            op = random.randrange(3)
+            if op == 0 and x not in ref:
+                prio[x] = random.random()
+                ref.push(x)
+                h.push(x)
+            elif op == 1:
+                ref.discard(x)
+                h.discard(x)
+            elif ref:
+                self.assertEqual(h.pop(), ref.pop())
+        self.assertEqual(list(h.pop_all()), list(ref.pop_all()))
+        self.assertLessEqual(h.peak_len, 2000)
+
+
+class Test_BoundedHeapSet(unittest.TestCase):
+    def _check_invariant(self, h):
+        heap = h._heap_of_decs
+        for pos in range(1, len(heap)):
+            ancestor = (pos-1)//2
+            while 1:
+                if _is_min_level(ancestor):
+                    self.assertFalse(heap[pos] < heap[ancestor])
+                else:
+                    self.assertFalse(heap[ancestor] < heap[pos])
+                if ancestor == 0:
+                    break
+                ancestor = (ancestor-1)//2
+        for ele,pos in h._ele_to_pos.items():
+            self.assertEqual(h._undecorate(heap[pos]), ele)
+
+    def test_top_k(self):
+        h = BoundedHeapSet([], capacity=3)
+        evicted = [h.push(n) for n in [5, 9, 2, 7, 1, 8, 3]]
+        self.assertEqual(evicted, [None, None, None, 9, 7, 8, 5])
+        self.assertEqual(list(h), [1, 2, 3])
+        self.assertEqual(h.peek_max(), 3)
+        self.assertEqual(h.pop_max(), 3)
+        self.assertEqual(h.pop(), 1)
+        self.assertEqual(list(h.pop_all()), [2])
+        self.assertRaises(IndexError, h.pop_max)
+        self.assertRaises(ValueError, BoundedHeapSet, [], capacity=0)
+
+    def test_batch(self):
+        prio = {n: n for n in range(10)}
+        h = BoundedHeapSet([], capacity=4, key=prio.__getitem__)
+        self.assertEqual(h.push_many([5, 9, 2, 7, 1, 8]), [9, 8])
+        self.assertEqual(list(h), [1, 2, 5, 7])
+        self.assertRaises(KeyError, h.push_many, [3, 5])
+        self.assertRaises(KeyError, h.push_many, [3, 3])
+        self.assertEqual(list(h), [1, 2, 5, 7])
+        h.discard_many([2, 6, 7])
+        self.assertEqual(list(h), [1, 5])
+        prio[1] = 10
+        prio[5] = 0
+        h.recompute_keys([1, 5, 6])
+        self.assertEqual(list(h), [5, 1])
+        self._check_invariant(h)
+        self.assertEqual(h.push_many([0, 3, 4]), [1])
+
+    def test_random_against_sorted(self):
+        for capacity in [1, 2, 7, 30]:
+            prio = dict()
+            h = BoundedHeapSet([], capacity=capacity, key=prio.__getitem__)
+            # The model: priority and push number for each element.
+            model = dict()
+            seq = 0
+            for _ in range(1000):
+                x = random.randrange(50)
+                op = random.randrange(5)
+                if op == 0 and x not in h:
+                    prio[x] = random.randrange(20)
+                    model[x] = (prio[x], seq)
+                    seq += 1
+                    evicted = h.push(x)
+                    if len(model) > capacity:
+                        worst = max(model, key=model.__getitem__)
+                        del model[worst]
+                        self.assertEqual(evicted, worst)
+                    else:
+                        self.assertIsNone(evicted)
+                elif op == 1:
+                    h.discard(x)
+                    model.pop(x, None)
+                elif op == 2 and x in h:
+                    prio[x] = random.randrange(20)
+                    model[x] = (prio[x], seq)
+                    seq += 1
+                    h.recompute_key(x)
+                elif op == 3 and h:
+                    self.assertEqual(h.pop_max(), max(model, key=model.__getitem__))
+                    del model[max(model, key=model.__getitem__)]
+                elif op == 4 and h:
+                    self.assertEqual(h.pop(), min(model, key=model.__getitem__))
+                    del model[min(model, key=model.__getitem__)]
+                self._check_invariant(h)
+                self.assertEqual(list(h), sorted(model, key=model.__getitem__))
+
+
 if __name__=='__main__':
     unittest.main()
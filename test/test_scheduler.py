@@ -0,0 +1,51 @@
+import unittest, random, sys, os
+sys.path.insert(0, os.path.join(os.path.split(__file__)[0], '..'))
+from alug.scheduler import DeadlineScheduler
+
+
+class Test_DeadlineScheduler(unittest.TestCase):
+    def test_basic(self):
+        s = DeadlineScheduler()
+        self.assertIsNone(s.next_deadline())
+        s.schedule('a', 5)
+        s.schedule('b', 1)
+        s.schedule('c', 3)
+        s.schedule('d', 3)
+        self.assertRaises(KeyError, s.schedule, 'a', 2)
+        self.assertEqual(s.next_deadline(), 1)
+        self.assertEqual(s.pop_due(0), [])
+        self.assertEqual(s.pop_due(1), ['b'])
+        s.reschedule('c', 4)
+        s.cancel('a')
+        s.cancel('a')
+        self.assertRaises(KeyError, s.reschedule, 'a', 4)
+        self.assertEqual(s.deadline('c'), 4)
+        self.assertEqual(list(s), ['d', 'c'])
+        self.assertEqual(s.pop_due(10), ['d', 'c'])
+        self.assertFalse(s)
+
+    def test_churn(self):
+        # Timeouts that are mostly cancelled or moved before they fire.
+        s = DeadlineScheduler()
+        expected = dict()
+        for now in range(20000):
+            item = random.randrange(1000)
+            if item in s:
+                if random.randrange(2):
+                    s.cancel(item)
+                    del expected[item]
+                else:
+                    s.reschedule(item, now + 100)
+                    expected[item] = now + 100
+                # Cancelling and rescheduling compact the heap as needed.
+                self.assertLessEqual(s._heapset.dead_count, max(64, len(s)))
+            else:
+                s.schedule(item, now + random.randrange(50, 150))
+                expected[item] = s.deadline(item)
+            for item in s.pop_due(now):
+                self.assertLessEqual(expected.pop(item), now)
+        self.assertEqual(set(s), set(expected))
+
+
+if __name__=='__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
-import unittest, random, pprint, sys, os.path
+import unittest, random, pprint, sys, os.path, tempfile, array, concurrent.futures
 sys.path.insert(0, os.path.join(os.path.split(__file__)[0], '..'))
-from alug.topo import semi_topological_sort, stable_topological_sort, CycleError
+from alug.topo import semi_topological_sort, stable_topological_sort, numpy_topological_sort, TopoOrder, CycleError
+from alug.topo import stable_topological_generations, semi_topological_generations, iter_topological_sort
+from alug.topo import ConstraintGraph, read_edge_file, read_binary_edge_file, split_topological_sort
+from alug.topo import critical_path_topological_sort, _DeltaBuckets, _merge_orders, _Graph
+import alug.topo
 
 try:
     import graphlib
@@ -9,6 +13,12 @@ except ImportError:
     # alug.topo should work fine on older Python's just the same.
     graphlib = None
 
+try:
+    import numpy
+except ImportError:
+    # numpy_topological_sort is only tested where NumPy is installed.
+    numpy = None
+
 class Test_semi_topological_sort(unittest.TestCase):
     def testempty(self):
         self.assertEqual(
@@ -121,6 +131,123 @@ class Test_semi_topological_sort(unittest.TestCase):
              [1,4,2,3,5],
             )
 
+    def test_cycle_breaking_largest_difference(self):
+        # No sources or sinks; 'c' has the most outputs relative to inputs, so it goes first.
+        self.assertEqual(
+            semi_topological_sort(['a','b','c'], [('c','a'), ('c','b'), ('a','b'), ('b','c')]),
+            ['c', 'a', 'b'])
+
+    def test_cycle_breaking_ties(self):
+        # Equal differences all round; the first in the input goes first.
+        self.assertEqual(
+            semi_topological_sort(['b','c','a'], [('a','b'), ('b','c'), ('c','a')]),
+            ['b', 'c', 'a'])
+        self.assertEqual(
+            semi_topological_sort(['c','a','b'], [('a','b'), ('b','c'), ('c','a')]),
+            ['c', 'a', 'b'])
+
+    def test_cycle_breaking_after_removal(self):
+        # 2 starts with the largest difference, but once the sink 1 is placed, 0 and 2 are even
+        # and 0 goes first.
+        self.assertEqual(
+            semi_topological_sort([0,1,2], [(0,2), (2,0), (2,1)]),
+            [0, 2, 1])
+
+    def test_scc(self):
+        # Two 2-cycles inside a chain; within a cycle, input order decides.
+        self.assertEqual(
+            semi_topological_sort([6,5,4,3,2,1], [(1,2),(2,1),(2,3),(3,4),(4,5),(5,4),(5,6)], scc=True),
+            [2,1,3,5,4,6])
+        self.assertEqual(semi_topological_sort([], [], scc=True), [])
+
+    def test_scc_random(self):
+        for _ in range(100):
+            N_ele = random.randrange(1, 60)
+            elements = list(range(N_ele))
+            random.shuffle(elements)
+            conditions = [(random.randrange(N_ele), random.randrange(N_ele)) for _ in range(random.randrange(2*N_ele))]
+            res = semi_topological_sort(elements, conditions, scc=True)
+            self.assertEqual(sorted(res), sorted(elements))
+            dag = [(min(a,b), max(a,b)) for a,b in conditions]
+            self.assertEqual(semi_topological_sort(elements, dag, scc=True),
+                             semi_topological_sort(elements, dag))
+
+            # Constraints that aren't part of a cycle are satisfied.
+            positions = dict((ele,ix) for ix,ele in enumerate(res))
+            reaches = dict((ele, {ele}) for ele in elements)
+            for _ in elements:
+                for a,b in conditions:
+                    reaches[a] |= reaches[b]
+            for a,b in conditions:
+                if a not in reaches[b]:
+                    self.assertLess(positions[a], positions[b])
+
+    def test_return_violations(self):
+        self.assertEqual(semi_topological_sort([1,2], [(1,2),(2,1),(1,2)], return_violations=True),
+                         ([1,2], [(2,1)]))
+        self.assertEqual(semi_topological_sort([3,2,1], [(1,2),(2,3)], return_violations=True),
+                         ([1,2,3], []))
+        self.assertEqual(semi_topological_sort([], [], return_violations=True), ([], []))
+
+    def test_refine(self):
+        # The greedy heuristic violates two constraints here; moving 1 to the front leaves one.
+        conditions = [(0,2),(0,3),(1,0),(1,2),(2,1),(3,2)]
+        self.assertEqual(semi_topological_sort(range(4), conditions, return_violations=True),
+                         ([0,3,1,2], [(1,0),(2,1)]))
+        self.assertEqual(semi_topological_sort(range(4), conditions, refine_seconds=10, return_violations=True),
+                         ([1,0,3,2], [(2,1)]))
+        for _ in range(50):
+            N_ele = random.randrange(1, 40)
+            elements = list(range(N_ele))
+            random.shuffle(elements)
+            conditions = [(random.randrange(N_ele), random.randrange(N_ele)) for _ in range(random.randrange(3*N_ele))]
+            for scc in [False, True]:
+                res, violations = semi_topological_sort(elements, conditions, scc=scc, return_violations=True)
+                refined, refined_violations = semi_topological_sort(elements, conditions, scc=scc, refine_seconds=10,
+                                                                    return_violations=True)
+                self.assertEqual(sorted(refined), sorted(elements))
+                positions = dict((ele,ix) for ix,ele in enumerate(refined))
+                self.assertEqual(sorted(refined_violations),
+                                 sorted(set((a,b) for a,b in conditions if positions[a] > positions[b])))
+                self.assertLessEqual(len(refined_violations), len(violations))
+                if not violations:
+                    self.assertEqual(refined, res)
+                self.assertEqual(semi_topological_sort(elements, conditions, scc=scc, refine_seconds=0), res)
+
+    def test_stats(self):
+        for _ in range(20):
+            N_ele = random.randrange(1, 60)
+            elements = list(range(N_ele))
+            random.shuffle(elements)
+            conditions = [(random.randrange(N_ele), random.randrange(N_ele)) for _ in range(random.randrange(3*N_ele))]
+            for scc in [False, True]:
+                stats = dict()
+                self.assertEqual(semi_topological_sort(elements, conditions, scc=scc, stats=stats),
+                                 semi_topological_sort(elements, conditions, scc=scc))
+                self.assertEqual(stats['nodes'], N_ele)
+                self.assertEqual(stats['edges'], len(set((a,b) for a,b in conditions if a != b)))
+                self.assertEqual(stats['placed_as_source'] + stats['placed_as_sink'] + stats['placed_by_cycle_breaking'],
+                                 N_ele)
+                self.assertEqual(stats['heap_key_calls'], 0)
+                self.assertGreaterEqual(stats['sort_seconds'], 0)
+                self.assertNotIn('refine_seconds', stats)
+                self.assertEqual('components' in stats, scc)
+
+            dag = [(min(a,b), max(a,b)) for a,b in conditions]
+            stats = dict()
+            self.assertEqual(stable_topological_sort(elements, dag, stats=stats), stable_topological_sort(elements, dag))
+            self.assertEqual(stats['placed_as_source'], N_ele)
+            self.assertEqual(stats['placed_by_cycle_breaking'], 0)
+            self.assertEqual(stats['candidates_stale_skipped'], 0)
+
+        stats = dict()
+        semi_topological_sort([1,2], [(1,2),(2,1)], refine_seconds=1, stats=stats)
+        self.assertEqual(stats['placed_by_cycle_breaking'], 1)
+        self.assertIn('refine_seconds', stats)
+        stats = dict()
+        self.assertRaises(CycleError, stable_topological_sort, [1,2], [(1,2),(2,1)], stats=stats)
+        self.assertEqual(stats['nodes'], 2)
+
     def test_topology_10_3(self):
         for _ in range(10):
             self._test_topology(N_elements=10, N_conditions=3)
@@ -375,5 +502,435 @@ if graphlib is not None:
                 self._ex(elements, constraints)
 
 
+class Test_DeltaBuckets(unittest.TestCase):
+    def test_largest_difference(self):
+        candidates = _DeltaBuckets(array.array('l', [1,3,2]), array.array('l', [2,0,1]))
+        self.assertEqual([candidates.pop() for _ in range(3)], [1, 2, 0])
+        self.assertFalse(candidates)
+
+    def test_ties(self):
+        candidates = _DeltaBuckets(array.array('l', [2,2,2,2]), array.array('l', [1,1,1,1]))
+        candidates.change(3, +1)
+        candidates.change(3, -1)
+        candidates.change(0, -1)
+        candidates.change(0, +1)
+        self.assertEqual([candidates.pop() for _ in range(4)], [0, 1, 2, 3])
+
+    def test_change(self):
+        candidates = _DeltaBuckets(array.array('l', [0,0,0,0]), array.array('l', [0,0,0,0]))
+        candidates.change(3, +1)
+        self.assertEqual(candidates.pop(), 3)
+        candidates.change(0, -1)
+        candidates.discard(1)
+        candidates.change(2, +2)
+        candidates.change(2, -1)
+        self.assertEqual(candidates.pop(), 2)
+        self.assertTrue(candidates)
+        self.assertEqual(candidates.pop(), 0)
+        self.assertFalse(candidates)
+
+    def test_random_against_scan(self):
+        # Compare with picking by a linear scan over the current differences.
+        for _ in range(50):
+            n = random.randrange(1, 30)
+            outs = array.array('l', (random.randrange(5) for _ in range(n)))
+            ins = array.array('l', (random.randrange(5) for _ in range(n)))
+            delta = {v: outs[v] - ins[v] for v in range(n)}
+            candidates = _DeltaBuckets(outs, ins)
+            while delta:
+                for _ in range(random.randrange(4)):
+                    v = random.randrange(n)
+                    change = random.choice([-1, +1])
+                    candidates.change(v, change)
+                    if v in delta:
+                        delta[v] += change
+                if random.random() < 0.2:
+                    v = random.choice(list(delta))
+                    candidates.discard(v)
+                    del delta[v]
+                    continue
+                v = min(delta, key=lambda v: (-delta[v], v))
+                self.assertEqual(candidates.pop(), v)
+                del delta[v]
+            self.assertFalse(candidates)
+
+
+class Test_iter_topological_sort(unittest.TestCase):
+    def test_examples(self):
+        self.assertEqual(list(iter_topological_sort([], [])), [])
+        self.assertEqual(list(iter_topological_sort([4,3,2,1], [(1,2),(3,4)])), [3,4,1,2])
+        self.assertEqual(list(iter_topological_sort([5,1,4,2,3], [(1,2),(2,3),(3,4),(4,5)])), [1,2,3,4,5])
+        it = iter_topological_sort([1,2,3,4], [(2,3),(3,2)])
+        self.assertEqual(next(it), 1)
+        self.assertEqual(next(it), 4)
+        self.assertRaises(CycleError, next, it)
+
+    def test_random(self):
+        # Each item is the earliest in input order of those whose 'before' items have been yielded.
+        for _ in range(100):
+            N_ele = random.randrange(1, 50)
+            elements = list(range(N_ele))
+            random.shuffle(elements)
+            conditions = [(random.randrange(N_ele), random.randrange(N_ele)) for _ in range(random.randrange(2*N_ele))]
+            conditions = [(min(a,b), max(a,b)) for a,b in conditions if a != b]
+            expected = []
+            remaining = list(elements)
+            while remaining:
+                ready = [ele for ele in remaining if all(a not in remaining for a,b in conditions if b == ele)]
+                expected.append(ready[0])
+                remaining.remove(ready[0])
+            self.assertEqual(list(iter_topological_sort(elements, conditions)), expected)
+            self.assertEqual(expected, stable_topological_sort(elements, conditions))
+
+
+class Test_topological_generations(unittest.TestCase):
+    def check_generations(self, generations, elements, conditions, dropped=0):
+        self.assertEqual(sorted(ele for level in generations for ele in level), sorted(elements))
+        level_of = dict((ele,no) for no,level in enumerate(generations) for ele in level)
+        violations = set((a,b) for a,b in conditions if a != b and level_of[a] >= level_of[b])
+        self.assertLessEqual(len(violations), dropped)
+        input_pos = dict((ele,no) for no,ele in enumerate(elements))
+        for no,level in enumerate(generations):
+            self.assertEqual(level, sorted(level, key=input_pos.__getitem__))
+            if no > 0:
+                # Each item is in the earliest generation possible.
+                for ele in level:
+                    self.assertIn(no-1, [level_of[a] for a,b in conditions if b == ele and (a,b) not in violations])
+
+    def test_examples(self):
+        self.assertEqual(list(stable_topological_generations([], [])), [])
+        self.assertEqual(list(stable_topological_generations([5,4,3,2,1], [(1,2),(1,3),(3,2),(5,2)])),
+                         [[5,4,1], [3], [2]])
+        self.assertRaises(CycleError, list, stable_topological_generations([1,2,3], [(1,2),(2,1)]))
+        self.assertEqual(list(semi_topological_generations([1,2,3], [(1,2),(2,1)])), [[1,3], [2]])
+
+    def test_random(self):
+        for _ in range(100):
+            N_ele = random.randrange(1, 60)
+            elements = list(range(N_ele))
+            random.shuffle(elements)
+            conditions = [(random.randrange(N_ele), random.randrange(N_ele)) for _ in range(random.randrange(2*N_ele))]
+            dag = [(min(a,b), max(a,b)) for a,b in conditions]
+            self.check_generations(list(stable_topological_generations(elements, dag)), elements, dag)
+            self.check_generations(list(semi_topological_generations(elements, dag)), elements, dag)
+
+            order = semi_topological_sort(elements, conditions)
+            positions = dict((ele,ix) for ix,ele in enumerate(order))
+            dropped = len(set((a,b) for a,b in conditions if positions[a] > positions[b]))
+            generations = list(semi_topological_generations(elements, conditions))
+            self.check_generations(generations, elements, conditions, dropped)
+
+
+class Test_Graph(unittest.TestCase):
+    def test_dedup_while_reading(self):
+        # Dropping duplicates along the way, as done for long inputs, gives the same graph.
+        def csr(graph):
+            return (graph.labels, list(graph.out_start), list(graph.out_adj), list(graph.in_start), list(graph.in_adj))
+        for _ in range(20):
+            N_ele = random.randrange(1, 30)
+            elements = list(range(N_ele))
+            random.shuffle(elements)
+            conditions = [(random.randrange(N_ele), random.randrange(N_ele)) for _ in range(random.randrange(8*N_ele))]
+            expected = csr(_Graph(elements, conditions)), csr(_Graph.from_pairs(conditions))
+            saved = alug.topo._DEDUP_MIN_EDGES
+            alug.topo._DEDUP_MIN_EDGES = random.randrange(1, 10)
+            try:
+                self.assertEqual((csr(_Graph(elements, conditions)), csr(_Graph.from_pairs(conditions))), expected)
+            finally:
+                alug.topo._DEDUP_MIN_EDGES = saved
+
+
+class Test_ConstraintGraph(unittest.TestCase):
+    def test_basic(self):
+        graph = ConstraintGraph([('a','b'), ('b','c'), ('a','b'), ('c','d')])
+        self.assertEqual(graph.n_constraints(), 3)
+        self.assertEqual(len(graph), 4)
+        self.assertIn('d', graph)
+        self.assertNotIn('e', graph)
+        self.assertEqual(graph.sort(['d','c','b','a']), ['a','b','c','d'])
+        # 'b' is not sorted, so the constraints through it are ignored.
+        self.assertEqual(graph.sort(['e','c','a','d']), ['e','c','a','d'])
+        self.assertEqual(graph.sort([]), [])
+        self.assertRaises(CycleError, ConstraintGraph([(1,2),(2,1)]).sort, [2,1,3])
+        self.assertEqual(ConstraintGraph([(1,2),(2,1)]).sort([1,3]), [1,3])
+
+    def test_items(self):
+        graph = ConstraintGraph(iter([(3,1), (1,2), (3,1), (4,4)]))
+        self.assertEqual(graph.items(), [3,1,2,4])
+        self.assertEqual(graph.n_constraints(), 2)
+        self.assertEqual(len(graph), 4)
+        self.assertEqual(graph.sort(graph.items()), [3,1,2,4])
+
+    def test_random_against_functions(self):
+        for _ in range(50):
+            N_ele = random.randrange(1, 40)
+            conditions = [(random.randrange(N_ele), random.randrange(N_ele)) for _ in range(random.randrange(3*N_ele))]
+            dag = [(min(a,b), max(a,b)) for a,b in conditions]
+            graph = ConstraintGraph(conditions)
+            dag_graph = ConstraintGraph(iter(dag))
+            for _ in range(5):
+                elements = random.sample(range(N_ele+5), random.randrange(N_ele+5))
+                elements += random.sample(elements, len(elements)//4)
+                present = set(elements)
+                subset = [(a,b) for a,b in conditions if a in present and b in present]
+                dag_subset = [(a,b) for a,b in dag if a in present and b in present]
+                self.assertEqual(dag_graph.sort(elements), stable_topological_sort(elements, dag_subset))
+                for scc in [False, True]:
+                    self.assertEqual(graph.semi_sort(elements, scc=scc, return_violations=True),
+                                     semi_topological_sort(elements, subset, scc=scc, return_violations=True))
+
+
+class Test_edge_files(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_text(self):
+        path = self.write('edges.txt', b'# before after\nb a\n\n  c\tb \r\nc b\n')
+        self.assertEqual(list(read_edge_file(path)), [('b','a'), ('c','b'), ('c','b')])
+        self.assertEqual(stable_topological_sort('abc', read_edge_file(path)), ['c','b','a'])
+        path = self.write('numbers.txt', b'2 1\n3 2\n')
+        self.assertEqual(list(read_edge_file(path, convert=int)), [(2,1), (3,2)])
+        self.assertEqual(semi_topological_sort([1,2,3], read_edge_file(path, convert=int)), [3,2,1])
+
+    def test_csv(self):
+        path = self.write('edges.csv', b'"a,1", b\r\nb,c\n')
+        self.assertEqual(list(read_edge_file(path, delimiter=',')), [('a,1','b'), ('b','c')])
+
+    def test_bad_line(self):
+        path = self.write('edges.txt', b'a b\nc\n')
+        self.assertRaises(ValueError, list, read_edge_file(path))
+        path = self.write('edges.txt', b'a b c\n')
+        self.assertRaises(ValueError, list, read_edge_file(path))
+
+    def test_binary(self):
+        path = self.write('edges.bin', array.array('i', [3,1, 1,2, 3,1]).tobytes())
+        self.assertEqual(list(read_binary_edge_file(path)), [(3,1), (1,2), (3,1)])
+        graph = ConstraintGraph(read_binary_edge_file(path))
+        self.assertEqual(graph.sort([1,2,3]), [3,1,2])
+        # Stopping early unmaps the file.
+        pairs = read_binary_edge_file(path)
+        self.assertEqual(next(pairs), (3,1))
+        pairs.close()
+        self.assertEqual(list(read_binary_edge_file(self.write('empty.bin', b''))), [])
+        self.assertRaises(ValueError, list, read_binary_edge_file(self.write('odd.bin', b'\0' * 12)))
+
+
+class Test_split_topological_sort(unittest.TestCase):
+    def random_problem(self):
+        N_ele = random.randrange(1, 60)
+        elements = list(range(N_ele))
+        random.shuffle(elements)
+        # A few separate groups, with constraints only within them.
+        group = dict((ele, random.randrange(4)) for ele in elements)
+        conditions = [(a,b) for a,b in ((random.choice(elements), random.choice(elements))
+                                         for _ in range(random.randrange(2*N_ele)))
+                      if group[a] == group[b]]
+        return elements, conditions
+
+    def test_basic(self):
+        self.assertEqual(split_topological_sort([], []), [])
+        self.assertEqual(split_topological_sort([4,3,2,1], [(1,3),(2,4)]), [2,4,1,3])
+        self.assertRaises(CycleError, split_topological_sort, [1,2,3], [(1,2),(2,1)])
+        self.assertEqual(split_topological_sort([3,2,1], [(1,2),(2,1)], semi=True), [3,2,1])
+
+    def test_merge_orders(self):
+        # The lists need not be sorted; the lowest next id goes first.
+        self.assertEqual(_merge_orders([[3,0,5], [1,4,2]]), [1,3,0,4,2,5])
+        self.assertEqual(_merge_orders([[], [2,1], [0]]), [0,2,1])
+        self.assertEqual(_merge_orders([]), [])
+
+    def test_random_stable(self):
+        for _ in range(100):
+            elements, conditions = self.random_problem()
+            dag = [(min(a,b), max(a,b)) for a,b in conditions]
+            self.assertEqual(split_topological_sort(elements, dag), stable_topological_sort(elements, dag))
+
+    def test_random_semi(self):
+        # Each component is ordered as semi_topological_sort orders it alone.
+        for _ in range(100):
+            elements, conditions = self.random_problem()
+            scc = random.random() < 0.5
+            res = split_topological_sort(elements, conditions, semi=True, scc=scc)
+            self.assertEqual(sorted(res), sorted(elements))
+            neighbours = dict((ele, {ele}) for ele in elements)
+            for a,b in conditions:
+                neighbours[a].add(b)
+                neighbours[b].add(a)
+            for ele in elements:
+                component = {ele}
+                while True:
+                    grown = set().union(*(neighbours[e] for e in component))
+                    if grown == component:
+                        break
+                    component = grown
+                self.assertEqual([e for e in res if e in component],
+                                 semi_topological_sort([e for e in elements if e in component],
+                                                       [(a,b) for a,b in conditions if a in component],
+                                                       scc=scc))
+
+    def test_executor(self):
+        elements = list(range(200))
+        random.shuffle(elements)
+        conditions = [(random.randrange(100), random.randrange(100)) for _ in range(150)]
+        conditions += [(random.randrange(100, 200), random.randrange(100, 200)) for _ in range(150)]
+        dag = [(min(a,b), max(a,b)) for a,b in conditions]
+        with concurrent.futures.ProcessPoolExecutor(2) as executor:
+            self.assertEqual(split_topological_sort(elements, dag, executor=executor, min_parallel_size=2),
+                             stable_topological_sort(elements, dag))
+            self.assertEqual(split_topological_sort(elements, conditions, semi=True, executor=executor,
+                                                    min_parallel_size=2),
+                             split_topological_sort(elements, conditions, semi=True))
+
+
+class Test_critical_path_topological_sort(unittest.TestCase):
+    def test_basic(self):
+        self.assertEqual(critical_path_topological_sort([], []), [])
+        # The chain goes first, the rest in input order.
+        self.assertEqual(critical_path_topological_sort([4,5,1,2,3], [(1,2),(2,3)]), [1,2,4,5,3])
+        cost = {1: 1, 2: 1, 3: 1, 4: 10, 5: 1}
+        self.assertEqual(critical_path_topological_sort([4,5,1,2,3], [(1,2),(2,3)], cost=cost.__getitem__),
+                         [4,1,2,5,3])
+        self.assertRaises(CycleError, critical_path_topological_sort, [1,2,3], [(1,2),(2,1)])
+
+    def test_random(self):
+        for _ in range(50):
+            N_ele = random.randrange(1, 40)
+            elements = list(range(N_ele))
+            random.shuffle(elements)
+            conditions = [(random.randrange(N_ele), random.randrange(N_ele)) for _ in range(random.randrange(2*N_ele))]
+            conditions = [(min(a,b), max(a,b)) for a,b in conditions if a != b]
+            cost = dict((ele, random.randrange(1, 5)) for ele in elements)
+            res = critical_path_topological_sort(elements, conditions, cost=cost.__getitem__)
+
+            # The longest path from each item, computed from the highest item down.
+            length = dict()
+            for ele in sorted(elements, reverse=True):
+                length[ele] = cost[ele] + max([length[b] for a,b in conditions if a == ele], default=0)
+            # Each item placed is a ready item with the longest path, and the first in input order of those.
+            placed = set()
+            for ele in res:
+                ready = [e for e in elements if e not in placed
+                         and all(a in placed for a,b in conditions if b == e)]
+                longest = max(length[e] for e in ready)
+                self.assertEqual(ele, [e for e in ready if length[e] == longest][0])
+                placed.add(ele)
+            self.assertEqual(sorted(res), sorted(elements))
+
+
+class Test_TopoOrder(unittest.TestCase):
+    def check_order(self, topo):
+        order = topo.order
+        self.assertEqual([topo.position(item) for item in order], list(range(len(order))))
+        for before,after in topo.constraints():
+            self.assertLess(topo.position(before), topo.position(after))
+
+    def test_basic(self):
+        topo = TopoOrder([1,2,3,4], [(3,1)])
+        self.assertEqual(list(topo.order), [2,3,1,4])
+        topo.add_constraint(4, 3)
+        self.assertEqual(list(topo.order), [2,4,3,1])
+        topo.add_constraint(1, 2)
+        self.assertEqual(list(topo.order), [4,3,1,2])
+        self.assertRaises(CycleError, topo.add_constraint, 2, 4)
+        self.assertEqual(list(topo.order), [4,3,1,2])
+        topo.remove_constraint(4, 3)
+        topo.add_constraint(2, 4)
+        self.assertEqual(list(topo.order), [3,1,2,4])
+        topo.add(0)
+        topo.add_constraint(0, 3)
+        self.assertEqual(list(topo.order), [0,3,1,2,4])
+        topo.remove(3)
+        self.assertEqual(list(topo.order), [0,1,2,4])
+        self.assertEqual(topo.position(4), 3)
+        self.assertNotIn(3, topo)
+        self.assertRaises(KeyError, topo.add, 4)
+        self.assertRaises(CycleError, TopoOrder, [1,2], [(1,2),(2,1)])
+        self.check_order(topo)
+
+    def test_order_view(self):
+        topo = TopoOrder([1,2,3], [(3,1)])
+        order = topo.order
+        self.assertEqual((len(order), order[0], order[-1], list(order[1:])), (3, 2, 1, [3, 1]))
+        self.assertIn(3, order)
+        self.assertEqual(order.index(1), 2)
+        topo.add_constraint(1, 2)
+        self.assertEqual(list(order), [3, 1, 2])
+        with self.assertRaises(TypeError):
+            order[0] = 4
+
+    def test_random(self):
+        N_ele = 40
+        topo = TopoOrder(range(N_ele))
+        constraints = set()
+        for _ in range(1000):
+            a = random.randrange(N_ele)
+            b = random.randrange(N_ele)
+            if a == b:
+                continue
+            if (a,b) in constraints and random.randrange(2):
+                topo.remove_constraint(a, b)
+                constraints.discard((a,b))
+                continue
+            try:
+                topo.add_constraint(a, b)
+            except CycleError:
+                self.assertRaises(CycleError, stable_topological_sort, range(N_ele), list(constraints) + [(a,b)])
+            else:
+                constraints.add((a,b))
+            self.check_order(topo)
+        self.assertEqual(set(topo.constraints()), constraints)
+
+
+if numpy is not None:
+    class Test_numpy_topological_sort(unittest.TestCase):
+        def test_examples(self):
+            self.assertEqual(numpy_topological_sort(numpy.zeros((0,2), dtype=int), n=0).tolist(), [])
+            self.assertEqual(numpy_topological_sort([(3,1)], n=4).tolist(), [0,2,3,1])
+            self.assertEqual(
+                numpy_topological_sort(before=numpy.array([4,3]), after=numpy.array([1,2]), items=[1,4,3,2]).tolist(),
+                [4,1,3,2])
+            # A tuple of pairs is edges, as for the tuple path.
+            self.assertEqual(numpy_topological_sort(((1,0),(3,2)), n=4).tolist(),
+                             stable_topological_sort(range(4), [(1,0),(3,2)]))
+            self.assertRaises(TypeError, numpy_topological_sort, [(1,0)], before=[1], after=[0])
+            self.assertRaises(TypeError, numpy_topological_sort, before=[1])
+            self.assertRaises(TypeError, numpy_topological_sort, [(1,0)], n=2, items=[0,1])
+            self.assertRaises(ValueError, numpy_topological_sort, before=[1,2], after=[0])
+            self.assertEqual(numpy_topological_sort([(1,2),(2,1)], semi=True).tolist(), [0,1,2])
+            self.assertRaises(CycleError, numpy_topological_sort, [(1,2),(2,1)])
+            self.assertRaises(KeyError, numpy_topological_sort, [(1,5)], items=[1,2])
+            self.assertRaises(KeyError, numpy_topological_sort, [(1,5)], n=3)
+            self.assertRaises(ValueError, numpy_topological_sort, [(1,2)], items=[1,2,1])
+            self.assertRaises(KeyError, numpy_topological_sort, [(1,2)], items=[])
+            # Labels are not limited by memory for a table indexed by them.
+            self.assertEqual(numpy_topological_sort([(10**11, 5)], items=[5, 10**11]).tolist(), [10**11, 5])
+            self.assertEqual(numpy_topological_sort([(-3, 5)], items=[5, -3, 0]).tolist(),
+                             stable_topological_sort([5, -3, 0], [(-3, 5)]))
+
+        def test_random_against_tuple_path(self):
+            for _ in range(100):
+                N_ele = random.randrange(1, 60)
+                items = list(range(0, 2*N_ele, 2))
+                random.shuffle(items)
+                edges = [(random.choice(items), random.choice(items)) for _ in range(random.randrange(2*N_ele))]
+                edge_array = numpy.array(edges, dtype=numpy.int64).reshape(-1, 2)
+                self.assertEqual(
+                    numpy_topological_sort(edge_array, items=items, semi=True).tolist(),
+                    semi_topological_sort(items, edges))
+                dag = [(min(a,b), max(a,b)) for a,b in edges]
+                self.assertEqual(
+                    numpy_topological_sort(numpy.array(dag, dtype=numpy.int64).reshape(-1, 2), items=items).tolist(),
+                    stable_topological_sort(items, dag))
+
+
 if __name__=='__main__':
     unittest.main()